@@ -85,6 +85,31 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Point RESERVATIONS_CACHE_ALIAS at a shared backend (e.g. Redis or Memcached) when running several workers.
+# It also holds the markers that revoke JWT room/floor claims, so every worker must see the same cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'washing-machine-app',
+    }
+}
+
+RESERVATIONS_CACHE_ALIAS = 'default'
+
+# Request window mode: instead of booking next week directly, rooms submit ranked slot
+# preferences during the current week and `manage.py allocate_reservations` (e.g. from cron
+# late on Sunday) hands out the slots. Direct booking into next week opens once it has run.
+RESERVATION_REQUEST_WINDOW = False
+
+# `manage.py archive_reservations` (e.g. nightly from cron) moves reservations that ended
+# before the week this many weeks back into ReservationArchive, keeping the live table small.
+# Run `manage.py refresh_usage_rollups` before it: only rolled up reservations are archived.
+RESERVATION_ARCHIVE_WEEKS = 4
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -106,7 +131,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # Configure REST framework to use JWT Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'reservations.authentication.FloorJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -118,8 +143,14 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'reservations.serializers.FloorTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'reservations.serializers.FloorTokenRefreshSerializer',
 }
 
+# Read requests trust the room, floor and staff claims in an access token for this long after
+# they were read from the database; older tokens load the user. /auth/refresh/ re-reads them.
+RESERVATION_CLAIMS_MAX_AGE = timedelta(minutes=15)
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -1,26 +1,72 @@
-import pytz
+from datetime import timedelta
 from django.utils import timezone
 from django.contrib import admin
-from datetime import time
 from django import forms
 from django.core.exceptions import ValidationError
-from django.db.models import F, ExpressionWrapper, DateTimeField
-from .models import Floor, Room, Individual, WashingMachineRoom, Reservation
+from django.db import transaction
+from django.db.models import Count, DurationField, Exists, IntegerField, OuterRef, Prefetch, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import (
+    Floor, FloorHourlyUsage, Room, Individual, RollupWatermark, WashingMachineRoom, Reservation, ReservationArchive
+)
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from .analytics import utilisation_report
+from .authentication import revoke_claims
+from .validation import BUCHAREST_TZ, START_OF_DAY, END_OF_DAY, week_bounds
 # Change the admin site title
 admin.site.site_header = 'Laundry Room Management'
 
 
+FLOOR_ADMINS_GROUP = 'Floor Admins'
+
+
+def is_floor_admin(request):
+    """Return whether the requesting user is a Floor Admin, querying the groups once per request."""
+    if not hasattr(request, '_is_floor_admin'):
+        request._is_floor_admin = request.user.groups.filter(name=FLOOR_ADMINS_GROUP).exists()
+    return request._is_floor_admin
+
+
+class FloorScopedAdminMixin:
+    """Limit Floor Admins to the objects on the floor they administer."""
+    floor_scope_field = 'floor'  # Lookup from the model to the floor id
+
+    def in_floor_scope(self, request, floor_id):
+        admin_floor = request.user.admin_floor
+        return admin_floor is not None and floor_id == admin_floor
+
+    def scope_to_floor(self, request, queryset):
+        if not is_floor_admin(request):
+            return queryset
+        admin_floor = request.user.admin_floor
+        if admin_floor is None:
+            return queryset.none()
+        return queryset.filter(**{self.floor_scope_field: admin_floor})
+
+    def get_queryset(self, request):
+        return self.scope_to_floor(request, super().get_queryset(request))
+
+
+def set_users_active(queryset, is_active):
+    """Update is_active in bulk; update() sends no post_save, so revoke the users' token claims here."""
+    user_ids = list(queryset.values_list('pk', flat=True))
+    queryset.update(is_active=is_active)
+    transaction.on_commit(lambda: revoke_claims(user_ids))
+
+
 def activate_users(modeladmin, request, queryset):
     """Activate selected users."""
-    queryset.update(is_active=True)
+    set_users_active(queryset, True)
     messages.success(request, f"{queryset.count()} user(s) were successfully activated.")
 
 activate_users.short_description = "Activate selected users"
 
 def deactivate_users(modeladmin, request, queryset):
     """Deactivate selected users."""
-    queryset.update(is_active=False)
+    set_users_active(queryset, False)
     messages.success(request, f"{queryset.count()} user(s) were successfully deactivated.")
 
 deactivate_users.short_description = "Deactivate selected users"
@@ -41,10 +87,10 @@ class RoomForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['individuals'].queryset = Individual.objects.filter(room__isnull=True) | Individual.objects.filter(room=self.instance)
         if self.instance.pk:
-            # Prepopulate the field with users already assigned to this room
-            self.fields['individuals'].initial = Individual.objects.filter(room=self.instance)
+            self.fields['individuals'].queryset = Individual.objects.filter(Q(room__isnull=True) | Q(room=self.instance))
+            # Prepopulate the field with users already assigned to this room (prefetched by RoomAdmin.get_queryset)
+            self.fields['individuals'].initial = [individual.pk for individual in self.instance.individual_set.all()]
 
     def clean_individuals(self):
         individuals = self.cleaned_data['individuals']
@@ -63,16 +109,22 @@ class RoomForm(forms.ModelForm):
         # Get the selected individuals from the form
         individuals = self.cleaned_data['individuals']
 
+        removed = Individual.objects.filter(room=instance).exclude(id__in=individuals)
+        # Both sides of the move change room and floor; update() sends no post_save to revoke their claims
+        moved_ids = [*individuals.values_list('pk', flat=True), *removed.values_list('pk', flat=True)]
+
         # Assign selected individuals to this room
         individuals.update(room=instance)
 
         # Unassign individuals that were previously assigned but are now unchecked
-        Individual.objects.filter(room=instance).exclude(id__in=individuals).update(room=None)
+        removed.update(room=None)
+
+        transaction.on_commit(lambda: revoke_claims(moved_ids))
 
         return instance
 
 # Custom admin class to display additional information about rooms
-class RoomAdmin(admin.ModelAdmin):
+class RoomAdmin(FloorScopedAdminMixin, admin.ModelAdmin):
     form = RoomForm
     readonly_fields = ('room_number', 'floor', 'max_occupants')
     list_display = ('room_number', 'floor', 'get_assigned_individuals')
@@ -86,91 +138,112 @@ class RoomAdmin(admin.ModelAdmin):
         return False
 
     def get_assigned_individuals(self, obj):
-        individuals = Individual.objects.filter(room=obj)
-        return ", ".join([individual.username for individual in individuals])
+        return ", ".join([individual.username for individual in obj.individual_set.all()])
     get_assigned_individuals.short_description = 'Assigned Individuals'
 
     def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        if request.user.groups.filter(name='Floor Admins').exists():
-            admin_floor = request.user.admin_floor
-            if admin_floor is not None:
-                return queryset.filter(floor=admin_floor)
-            else:
-                return queryset.none()
-        return queryset
+        # Fetch every room's occupants in one extra query instead of one per row
+        return super().get_queryset(request).select_related('floor').prefetch_related(
+            Prefetch('individual_set', queryset=Individual.objects.only('username', 'room'))
+        )
+
+def count_subquery(queryset, group_by):
+    """Wrap a per-floor count as a scalar subquery so it can be annotated onto the floor rows."""
+    counts = queryset.order_by().values(group_by).annotate(total=Count('pk', distinct=True)).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def sum_subquery(queryset, group_by, field, output_field):
+    """Wrap a per-floor sum as a scalar subquery, like count_subquery()."""
+    sums = queryset.order_by().values(group_by).annotate(total=Sum(field)).values('total')
+    return Subquery(sums, output_field=output_field)
+
 
 # Custom admin class to display additional information about floors
-class FloorAdmin(admin.ModelAdmin):
-    list_display = ('floor_number', 'room_count', 'occupied_rooms', 'total_individuals', 'washing_machine_room_status')
+class FloorAdmin(FloorScopedAdminMixin, admin.ModelAdmin):
+    floor_scope_field = 'pk'
+    list_display = (
+        'floor_number', 'room_count', 'occupied_rooms', 'total_individuals', 'washing_machine_room_status',
+        'reserved_this_week'
+    )
     readonly_fields = ('floor_number',)
 
 
     def room_count(self, obj):
-        return Room.objects.filter(floor=obj).count()
+        return obj.room_count
     room_count.short_description = 'Total Rooms'
+    room_count.admin_order_field = 'room_count'
 
     def occupied_rooms(self, obj):
-        return Room.objects.filter(floor=obj).exclude(individual__isnull=True).distinct().count()
+        return obj.occupied_rooms
     occupied_rooms.short_description = 'Occupied Rooms'
+    occupied_rooms.admin_order_field = 'occupied_rooms'
 
     def total_individuals(self, obj):
-        return Individual.objects.filter(room__floor=obj).count()
+        return obj.total_individuals
     total_individuals.short_description = 'Total Individuals'
+    total_individuals.admin_order_field = 'total_individuals'
 
     def washing_machine_room_status(self, obj):
-        washing_room = WashingMachineRoom.objects.filter(floor=obj).first()
-        if not washing_room:
+        if not obj.has_washing_room:
             return "No Washing Machine Room"
 
-        # Get current time in Bucharest timezone
-        bucharest_tz = pytz.timezone('Europe/Bucharest')
-        now_in_bucharest = timezone.now().astimezone(bucharest_tz)
-        current_time = now_in_bucharest.time()
-
-        # Operational hours
-        start_of_day = time(7, 0)  # 7:00 AM
-        end_of_day = time(23, 0)   # 11:00 PM
-
-        # Check for current reservations
-        from django.db.models.functions import Now
-
-        # Annotate end_time as reservation_time + duration
-        current_reservations = Reservation.objects.filter(
-            floor=obj
-        ).annotate(
-            end_time=ExpressionWrapper(
-                F('reservation_time') + F('duration'),
-                output_field=DateTimeField()
-            )
-        ).filter(
-            reservation_time__lte=now_in_bucharest,
-            end_time__gte=now_in_bucharest
-        )
-
-        if current_reservations.exists():
+        if obj.is_occupied:
             return "Occupied"
 
+        # Get current time in Bucharest timezone
+        current_time = timezone.now().astimezone(BUCHAREST_TZ).time()
+
         # No current reservation
-        if start_of_day <= current_time <= end_of_day:
+        if START_OF_DAY <= current_time <= END_OF_DAY:
             return "Available"
         else:
             return "Closed"
 
     washing_machine_room_status.short_description = 'Washing Machine Room Status'
 
+    def reserved_this_week(self, obj):
+        reserved = timedelta(seconds=obj.rolled_up_seconds or 0) + (obj.recent_duration or timedelta())
+        return f"{reserved.total_seconds() / 3600:.1f} h"
+    reserved_this_week.short_description = 'Reserved This Week'
+
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        if request.user.groups.filter(name='Floor Admins').exists():
-            admin_floor = request.user.admin_floor
-            if admin_floor is not None:
-                return queryset.filter(id=admin_floor)
-            else:
-                return queryset.none()
-        return queryset
+
+        # Compute every changelist column in the same statement that loads the floors
+        now = timezone.now()
+        week_start, week_end = week_bounds(now)
+        # This week's reserved time comes from the floor usage rollup, plus the bookings
+        # made since its last refresh
+        rolled_up_to = RollupWatermark.objects.filter(name=RollupWatermark.FLOOR_USAGE).values_list(
+            'rolled_up_to', flat=True
+        ).first()
+        rollup = FloorHourlyUsage.objects.filter(floor=OuterRef('pk'), week_start=week_start.date())
+        recent = Reservation.objects.filter(
+            floor=OuterRef('pk'), reservation_time__gte=week_start, reservation_time__lt=week_end
+        )
+        if rolled_up_to is None:
+            rollup = rollup.none()
+        else:
+            recent = recent.filter(created_at__gt=rolled_up_to)
+        return queryset.annotate(
+            room_count=count_subquery(Room.objects.filter(floor=OuterRef('pk')), 'floor'),
+            occupied_rooms=count_subquery(
+                Room.objects.filter(floor=OuterRef('pk'), individual__isnull=False), 'floor'
+            ),
+            total_individuals=count_subquery(Individual.objects.filter(room__floor=OuterRef('pk')), 'room__floor'),
+            has_washing_room=Exists(WashingMachineRoom.objects.filter(floor=OuterRef('pk'))),
+            is_occupied=Exists(Reservation.objects.filter(
+                floor=OuterRef('pk'),
+                reservation_time__lte=now,
+                end_time__gte=now
+            )),
+            rolled_up_seconds=sum_subquery(rollup, 'floor', 'reserved_seconds', IntegerField()),
+            recent_duration=sum_subquery(recent, 'floor', 'duration', DurationField()),
+        )
 
 # Custom admin class to disable add, edit, and delete actions for washing machine rooms
-class WashingMachineRoomAdmin(admin.ModelAdmin):
+class WashingMachineRoomAdmin(FloorScopedAdminMixin, admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
@@ -183,17 +256,8 @@ class WashingMachineRoomAdmin(admin.ModelAdmin):
     list_display = ('floor',)
     readonly_fields = ('floor',)
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        if request.user.groups.filter(name='Floor Admins').exists():
-            admin_floor = request.user.admin_floor
-            if admin_floor is not None:
-                return queryset.filter(floor=admin_floor)
-            else:
-                return queryset.none()
-        return queryset
-
-class IndividualAdmin(admin.ModelAdmin):
+class IndividualAdmin(FloorScopedAdminMixin, admin.ModelAdmin):
+    floor_scope_field = 'room__floor'
     fields = ['username', 'first_name', 'last_name', 'national_id', 'country', 'email', 'room', 'groups', 'validated_email', 'is_active']
     list_display = ('username', 'email', 'first_name', 'last_name', 'national_id', 'country', 'room','validated_email', 'is_active')
     search_fields = ('username', 'email', 'national_id')
@@ -201,35 +265,23 @@ class IndividualAdmin(admin.ModelAdmin):
     actions = [activate_users, deactivate_users]
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = super().get_readonly_fields(request, obj)
-        if obj is not None and request.user == obj and request.user.groups.filter(name='Floor Admins').exists():
+        if obj is not None and request.user == obj and is_floor_admin(request):
             return readonly_fields + ('is_active', 'groups')
-        if request.user.groups.filter(name='Floor Admins').exists():
+        if is_floor_admin(request):
             return readonly_fields + ('groups',)
         return readonly_fields
 
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
-        if request.user.groups.filter(name='Floor Admins').exists():
+        if is_floor_admin(request):
             form.base_fields.pop('groups', None)
         return form
 
     def has_delete_permission(self, request, obj=None):
-        if request.user.groups.filter(name='Floor Admins').exists():
-            if obj and obj.room and obj.room.floor == request.user.admin_floor:
-                return True
-            return False
+        if is_floor_admin(request):
+            return bool(obj and obj.room and self.in_floor_scope(request, obj.room.floor_id))
         return super().has_delete_permission(request, obj)
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        if request.user.groups.filter(name='Floor Admins').exists():
-            admin_floor = request.user.admin_floor
-            if admin_floor is not None:
-                return queryset.filter(room__floor=admin_floor)
-            else:
-                return queryset.none()
-        return queryset
-
 class ReservationForm(forms.ModelForm):
     class Meta:
         model = Reservation
@@ -247,7 +299,7 @@ class ReservationForm(forms.ModelForm):
 
         return cleaned_data
 
-class ReservationAdmin(admin.ModelAdmin):
+class ReservationAdmin(FloorScopedAdminMixin, admin.ModelAdmin):
     form = ReservationForm
     list_display = ['room', 'individual', 'get_floor', 'reservation_time', 'duration', 'created_at']
     list_filter = ['room__floor']
@@ -265,23 +317,64 @@ class ReservationAdmin(admin.ModelAdmin):
         return obj.room.floor.floor_number
     get_floor.short_description = 'Floor'
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        if request.user.groups.filter(name='Floor Admins').exists():
-            admin_floor = request.user.admin_floor
-            if admin_floor is not None:
-                return queryset.filter(room__floor=admin_floor)
-            else:
-                return queryset.none()
-        return queryset
+    def get_urls(self):
+        return [
+            path('analytics/', self.admin_site.admin_view(self.analytics_view), name='reservations_reservation_analytics'),
+        ] + super().get_urls()
+
+    def analytics_view(self, request):
+        """Weekday/hour utilisation heatmap and per-room quota usage, scoped to a Floor Admin's floor."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        floor_id = None
+        if is_floor_admin(request):
+            floor_id = request.user.admin_floor
+            if floor_id is None:
+                raise PermissionDenied
+        report = utilisation_report(floor_id=floor_id)
+
+        heatmap = report['heatmap']
+        rows = [
+            (weekday, [(minutes, round(share * 100), f'{min(share, 1):.2f}') for minutes, share in zip(minutes_row, share_row)])
+            for weekday, minutes_row, share_row in zip(
+                heatmap['weekdays'], heatmap['reserved_minutes'], heatmap['utilisation']
+            )
+        ]
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Washing machine utilisation',
+            'report': report,
+            'hours': heatmap['hours'],
+            'heatmap_rows': rows,
+        }
+        return TemplateResponse(request, 'admin/reservations/reservation/analytics.html', context)
 
     def has_delete_permission(self, request, obj=None):
-        if obj and request.user.groups.filter(name='Floor Admins').exists():
-            return obj.room.floor == request.user.admin_floor
+        if obj and is_floor_admin(request):
+            return self.in_floor_scope(request, obj.floor_id)
         return super().has_delete_permission(request, obj)
 
+class ReservationArchiveAdmin(FloorScopedAdminMixin, admin.ModelAdmin):
+    list_display = ['room', 'individual', 'floor', 'reservation_time', 'duration', 'created_at', 'archived_at']
+    list_filter = ['room__floor']
+    list_select_related = ['room', 'individual', 'floor']
+    search_fields = ['individual__username', 'individual__last_name', 'room__room_number']
+
+    # Archived reservations are history: readable, never edited
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.register(Individual, IndividualAdmin)
 admin.site.register(Floor, FloorAdmin)
 admin.site.register(Room, RoomAdmin)
 admin.site.register(WashingMachineRoom, WashingMachineRoomAdmin)
 admin.site.register(Reservation, ReservationAdmin)
+admin.site.register(ReservationArchive, ReservationArchiveAdmin)
@@ -0,0 +1,155 @@
+import heapq
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .intervals import FloorIntervals
+from .models import AllocationRun, Floor, Reservation, RoomWeeklyUsage, SlotPreference
+from .signals import reservations_created
+from .usage import reservations_saved
+from .validation import WEEKLY_LIMIT, schedule_error, week_bounds, week_bounds_of
+
+MAX_PREFERENCES = 10
+PENDING_ALLOCATION_ERROR = "Next week opens for booking once the request window has been allocated."
+
+
+def request_window_enabled():
+    return getattr(settings, 'RESERVATION_REQUEST_WINDOW', False)
+
+
+def request_week(now=None):
+    """Monday of the week preferences are collected for: next week."""
+    return week_bounds(now or timezone.now())[1].date()
+
+
+def allocation_pending(reservation_time, now=None):
+    """Return True if request window mode holds back reservation_time's week until it is allocated."""
+    if not request_window_enabled():
+        return False
+    week_start = week_bounds(reservation_time)[0]
+    if week_start <= week_bounds(now or timezone.now())[0]:
+        return False
+    return not AllocationRun.objects.filter(week_start=week_start.date()).exists()
+
+
+def allocate_floor(preferences, intervals, reserved, seed=None):
+    """
+    Share one floor's slots out between its rooms' ranked preferences.
+
+    preferences maps room id -> SlotPreference list in rank order, intervals holds the
+    floor's existing reservations and reserved maps room id -> time already booked that
+    week. Rooms take turns, the one with the least time so far going first (ties in a
+    seeded random order), and each turn grants the room's best preference that still
+    fits the floor and its quota. Earlier choices that no longer fit never will, so every
+    preference is looked at once. Returns (allocated, rejected) preference lists.
+    """
+    order = sorted(preferences)
+    random.Random(seed).shuffle(order)
+    turns = [(reserved.get(room_id, timedelta()), position, room_id) for position, room_id in enumerate(order)]
+    heapq.heapify(turns)
+    cursors = dict.fromkeys(order, 0)
+
+    allocated, rejected = [], []
+    while turns:
+        _, position, room_id = heapq.heappop(turns)
+        ranked = preferences[room_id]
+        while cursors[room_id] < len(ranked):
+            preference = ranked[cursors[room_id]]
+            cursors[room_id] += 1
+            end_time = preference.reservation_time + preference.duration
+            room_total = reserved.get(room_id, timedelta()) + preference.duration
+            if room_total > WEEKLY_LIMIT or intervals.overlaps(preference.reservation_time, end_time):
+                rejected.append(preference)
+                continue
+
+            intervals.add(preference.reservation_time, end_time)
+            reserved[room_id] = room_total
+            allocated.append(preference)
+            heapq.heappush(turns, (room_total, position, room_id))
+            break
+    return allocated, rejected
+
+
+def allocate_week(week_start, now=None):
+    """
+    Turn the pending preferences for a week into reservations and record the AllocationRun.
+
+    Runs in one transaction with the affected floors locked; all reservations are
+    inserted with a single bulk_create(). Raises IntegrityError if the week was
+    already allocated.
+    """
+    now = now or timezone.now()
+    week_begin, week_end = week_bounds_of(week_start)
+
+    with transaction.atomic():
+        run = AllocationRun.objects.create(week_start=week_start)
+
+        pending = SlotPreference.objects.filter(
+            week_start=week_start, status=SlotPreference.PENDING
+        ).select_related('room').order_by('room_id', 'rank')
+        by_floor = defaultdict(lambda: defaultdict(list))
+        rejected = []
+        for preference in pending:
+            if schedule_error(preference.reservation_time, preference.duration, now):
+                rejected.append(preference)  # E.g. the slot is already in the past
+            else:
+                by_floor[preference.room.floor_id][preference.room_id].append(preference)
+
+        # Direct bookings take the same floor locks, so none can slip in while allocating
+        list(Floor.objects.select_for_update().filter(pk__in=by_floor).values_list('pk'))
+
+        floor_intervals = defaultdict(FloorIntervals)
+        existing = Reservation.objects.filter(
+            floor_id__in=by_floor, reservation_time__lt=week_end, end_time__gt=week_begin
+        ).values_list('floor_id', 'reservation_time', 'end_time', 'pk')
+        for floor_id, start, end, pk in existing:
+            floor_intervals[floor_id].add(start, end, pk)
+        reserved = {
+            room_id: timedelta(minutes=minutes)
+            for room_id, minutes in RoomWeeklyUsage.objects.filter(
+                week_start=week_start, room__floor_id__in=by_floor
+            ).values_list('room_id', 'reserved_minutes')
+        }
+
+        allocated = []
+        for floor_id, preferences in by_floor.items():
+            floor_allocated, floor_rejected = allocate_floor(
+                preferences, floor_intervals[floor_id], reserved, seed=f'{week_start}:{floor_id}'
+            )
+            allocated.extend(floor_allocated)
+            rejected.extend(floor_rejected)
+
+        reservations = [
+            Reservation(
+                room_id=preference.room_id, floor_id=preference.room.floor_id, individual_id=preference.individual_id,
+                reservation_time=preference.reservation_time, duration=preference.duration,
+                end_time=preference.reservation_time + preference.duration
+            )
+            for preference in allocated
+        ]
+        Reservation.objects.bulk_create(reservations, batch_size=1000)
+        reservations_saved(reservations)
+        reservations_created(reservations)
+
+        # A floor never has two reservations starting together, so room and start identify
+        # each new reservation; plain UPDATEs avoid bulk_update()'s per-row CASE expressions
+        created = Reservation.objects.filter(
+            room_id=OuterRef('room_id'), reservation_time=OuterRef('reservation_time')
+        ).values('pk')[:1]
+        allocated_ids = [preference.pk for preference in allocated]
+        for offset in range(0, len(allocated_ids), 1000):
+            SlotPreference.objects.filter(pk__in=allocated_ids[offset:offset + 1000]).update(
+                status=SlotPreference.ALLOCATED, reservation=Subquery(created)
+            )
+        SlotPreference.objects.filter(week_start=week_start, status=SlotPreference.PENDING).update(
+            status=SlotPreference.REJECTED
+        )
+
+        run.allocated, run.rejected = len(allocated), len(rejected)
+        run.save(update_fields=['allocated', 'rejected'])
+    return run
@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from django.db.models import Count, Max, Q, Sum
+
+from .archive import reservation_history
+from .models import Floor, FloorHourlyUsage, Reservation, RollupWatermark, RoomWeeklyUsage
+from .validation import BUCHAREST_TZ, WEEKLY_LIMIT, booking_window, week_bounds
+
+ANALYTICS_CHUNK_SIZE = 5000
+DEFAULT_WEEKS = 20  # Roughly a semester of history
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+COLUMN_FIELDS = ('floor_id', 'room_id', 'reservation_time', 'duration')
+COLUMNS = np.dtype([('floor', 'i8'), ('room', 'i8'), ('start', 'i8'), ('duration', 'i8')])
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def default_window(now=None):
+    """The last DEFAULT_WEEKS weeks plus the open booking window."""
+    window_start, window_end = booking_window(now)
+    return window_start - timedelta(weeks=DEFAULT_WEEKS), window_end
+
+
+def columns_of(rows, chunk_size=ANALYTICS_CHUNK_SIZE):
+    """Read COLUMN_FIELDS values_list() rows into one structured array, in seconds."""
+    return np.fromiter(
+        (
+            (floor or 0, room, int(start.timestamp()), int(duration.total_seconds()))
+            for floor, room, start, duration in rows.iterator(chunk_size=chunk_size)
+        ),
+        dtype=COLUMNS
+    )
+
+
+def load_columns(window_start, window_end, floor_id=None, created_after=None):
+    """Columns of the live and archived reservations starting in the window, optionally only recent ones."""
+    filters = {'reservation_time__gte': window_start, 'reservation_time__lt': window_end}
+    if floor_id is not None:
+        filters['floor_id'] = floor_id
+    if created_after is not None:
+        # Everything archived has been rolled up already, so only live rows can be this recent
+        return columns_of(Reservation.objects.filter(created_at__gt=created_after, **filters).values_list(*COLUMN_FIELDS))
+    return columns_of(reservation_history(COLUMN_FIELDS, **filters))
+
+
+def local_seconds(utc_seconds):
+    """Shift UTC epoch seconds to Bucharest wall-clock seconds."""
+    # The offset only changes on the hour, so look it up once per distinct hour rather than per row
+    hours, inverse = np.unique(utc_seconds // HOUR, return_inverse=True)
+    offsets = np.array([
+        datetime.fromtimestamp(hour * HOUR, timezone.utc).astimezone(BUCHAREST_TZ).utcoffset().total_seconds()
+        for hour in hours.tolist()
+    ], dtype='i8')
+    return utc_seconds + offsets[inverse]
+
+
+def hour_of_week(local):
+    """Monday-based hour of the week (0-167) of local epoch seconds."""
+    weekday = (local // DAY + 3) % 7  # 1 January 1970 was a Thursday
+    return weekday * 24 + (local % DAY) // HOUR
+
+
+def hour_pieces(columns):
+    """
+    Split reservations at Bucharest hour boundaries.
+
+    Returns (row, hour, seconds, starts) arrays with one entry per piece: the row in
+    columns, the local epoch second the hour begins, the seconds reserved in it and
+    whether the reservation starts in it. Reservations last at most 4 hours, so each
+    one splits into at most 5 pieces.
+    """
+    if not len(columns):
+        empty = np.zeros(0, dtype='i8')
+        return empty, empty, empty, np.zeros(0, dtype=bool)
+
+    start = local_seconds(columns['start'])
+    end = start + columns['duration']
+    first_hour = start // HOUR * HOUR
+    rows = np.arange(len(columns))
+    parts = []
+    for piece in range(int(-(-columns['duration'].max() // HOUR)) + 1):
+        hour = first_hour + piece * HOUR
+        seconds = np.minimum(end, hour + HOUR) - np.maximum(start, hour)
+        keep = (seconds > 0) | (piece == 0)
+        parts.append((rows[keep], hour[keep], np.clip(seconds[keep], 0, None), np.full(keep.sum(), piece == 0)))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+def binned_usage(columns):
+    """Reserved seconds and reservation starts per hour of the week (168 each)."""
+    _, hours, seconds, starts = hour_pieces(columns)
+    slots = hour_of_week(hours)
+    return (
+        np.bincount(slots, weights=seconds, minlength=7 * 24),
+        np.bincount(slots, weights=starts, minlength=7 * 24),
+    )
+
+
+def rolled_up_usage(window_start, window_end, floor_id=None):
+    """Reserved seconds and reservation starts per hour of the week, summed from the floor rollup."""
+    reserved, starts = np.zeros(7 * 24), np.zeros(7 * 24)
+    rollup = FloorHourlyUsage.objects.filter(
+        week_start__gte=window_start.astimezone(BUCHAREST_TZ).date(),
+        week_start__lt=window_end.astimezone(BUCHAREST_TZ).date()
+    )
+    if floor_id is not None:
+        rollup = rollup.filter(floor_id=floor_id)
+    for hour, seconds, count in rollup.values('hour').annotate(
+        seconds=Sum('reserved_seconds'), count=Sum('reservations')
+    ).values_list('hour', 'seconds', 'count'):
+        reserved[hour], starts[hour] = seconds, count
+    return reserved, starts
+
+
+def weekday_hour_heatmap(reserved_seconds, window_start, window_end, floors):
+    """
+    Reserved minutes and utilisation per (weekday, hour) as 7x24 arrays.
+
+    Utilisation divides by the machine-minutes available in that weekday/hour over
+    the window for the given number of floors.
+    """
+    reserved = reserved_seconds / 60
+    window_hours = np.arange(int(window_start.timestamp()) // HOUR, int(window_end.timestamp()) // HOUR) * HOUR
+    occurrences = np.bincount(hour_of_week(local_seconds(window_hours)), minlength=7 * 24)
+    available = occurrences * 60 * max(floors, 1)
+    utilisation = np.divide(reserved, available, out=np.zeros_like(reserved), where=available > 0)
+    return reserved.reshape(7, 24), utilisation.reshape(7, 24)
+
+
+def room_quota_usage(window_start, window_end, floor_id=None):
+    """Per-room weekly quota statistics, aggregated from the weekly usage counters."""
+    counters = RoomWeeklyUsage.objects.filter(
+        week_start__gte=window_start.astimezone(BUCHAREST_TZ).date(),
+        week_start__lt=window_end.astimezone(BUCHAREST_TZ).date(),
+        reserved_minutes__gt=0
+    )
+    if floor_id is not None:
+        counters = counters.filter(room__floor_id=floor_id)
+    limit = int(WEEKLY_LIMIT.total_seconds() // 60)
+    rows = counters.values('room', 'room__room_number', 'room__floor__floor_number').annotate(
+        weeks_booked=Count('pk'),
+        total_minutes=Sum('reserved_minutes'),
+        max_weekly_minutes=Max('reserved_minutes'),
+        weeks_at_limit=Count('pk', filter=Q(reserved_minutes__gte=limit)),
+    ).order_by('room')
+    return [
+        {
+            'room': row['room'],
+            'room_number': row['room__room_number'],
+            'floor_number': row['room__floor__floor_number'],
+            'weeks_booked': row['weeks_booked'],
+            'total_minutes': row['total_minutes'],
+            'average_weekly_minutes': round(row['total_minutes'] / row['weeks_booked'], 1),
+            'max_weekly_minutes': row['max_weekly_minutes'],
+            'weeks_at_limit': row['weeks_at_limit'],
+        }
+        for row in rows
+    ]
+
+
+def utilisation_report(window_start=None, window_end=None, floor_id=None):
+    """
+    Heatmap and per-room quota usage for a window, by default the last semester.
+
+    The window is widened to whole weeks. Usage comes from the floor rollup and the
+    weekly usage counters; only reservations created since the rollup was last
+    refreshed are read from the reservations themselves.
+    """
+    if window_start is None or window_end is None:
+        default_start, default_end = default_window()
+        window_start = window_start or default_start
+        window_end = window_end or default_end
+    window_start = week_bounds(window_start)[0]
+    window_end = week_bounds(window_end - timedelta(microseconds=1))[1]
+
+    rolled_up_to = RollupWatermark.objects.filter(name=RollupWatermark.FLOOR_USAGE).values_list(
+        'rolled_up_to', flat=True
+    ).first()
+    reserved, starts = rolled_up_usage(window_start, window_end, floor_id) if rolled_up_to else (0, 0)
+    recent_reserved, recent_starts = binned_usage(load_columns(window_start, window_end, floor_id, rolled_up_to))
+
+    floors = 1 if floor_id is not None else Floor.objects.count()
+    reserved, utilisation = weekday_hour_heatmap(reserved + recent_reserved, window_start, window_end, floors)
+    return {
+        'window_start': window_start,
+        'window_end': window_end,
+        'floor': floor_id,
+        'rolled_up_to': rolled_up_to,
+        'reservations': int(np.sum(starts + recent_starts)),
+        'heatmap': {
+            'weekdays': WEEKDAYS,
+            'hours': list(range(24)),
+            'reserved_minutes': np.round(reserved).astype(int).tolist(),
+            'utilisation': np.round(utilisation, 3).tolist(),
+        },
+        'rooms': room_quota_usage(window_start, window_end, floor_id),
+    }
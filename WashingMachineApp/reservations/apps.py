@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReservationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reservations'
+
+    def ready(self):
+        # Register the Reservation signal handlers that keep the in-memory indexes current
+        from . import signals  # noqa: F401
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Floor, Reservation, ReservationArchive, RollupWatermark, SlotPreference
+from .validation import week_bounds
+
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def archive_weeks():
+    return getattr(settings, 'RESERVATION_ARCHIVE_WEEKS', 4)
+
+
+def reservation_history(fields, **filters):
+    """
+    values_list() of the live and archived reservations matching the filters, as one UNION ALL query.
+
+    The result can still be ordered and iterated, but not filtered further.
+    """
+    return Reservation.objects.filter(**filters).values_list(*fields).union(
+        ReservationArchive.objects.filter(**filters).values_list(*fields), all=True
+    )
+
+
+def archive_cutoff(weeks, now=None):
+    """Reservations that ended before this are archived: the start of the week, weeks weeks back."""
+    return week_bounds(now or timezone.now())[0] - timedelta(weeks=weeks)
+
+
+def archive_batch(pks):
+    """Copy one batch of reservations into the archive and delete them, in one short transaction."""
+    live, archive = (connection.ops.quote_name(model._meta.db_table) for model in (Reservation, ReservationArchive))
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in Reservation._meta.concrete_fields)
+    pk_column = connection.ops.quote_name(Reservation._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(pks))
+    params = [Reservation._meta.pk.get_db_prep_value(pk, connection) for pk in pks]
+
+    with transaction.atomic():
+        # The rows leave with a raw DELETE, so clear the one nullable reference to them first
+        SlotPreference.objects.filter(reservation_id__in=pks).update(reservation=None)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {archive} ({columns}) SELECT {columns} FROM {live} WHERE {pk_column} IN ({placeholders})",
+                params
+            )
+            cursor.execute(f"DELETE FROM {live} WHERE {pk_column} IN ({placeholders})", params)
+
+
+def archive_reservations(cutoff, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False):
+    """
+    Move reservations that ended before cutoff into ReservationArchive, batch by batch.
+
+    Only reservations already counted in the floor usage rollup are moved, so the
+    rollup never needs to read the archive to catch up. The rows leave without
+    post_delete signals: the weekly usage counters and the rollup keep counting them.
+    Returns {floor id: reservations moved}.
+    """
+    rolled_up_to = RollupWatermark.objects.filter(name=RollupWatermark.FLOOR_USAGE).values_list(
+        'rolled_up_to', flat=True
+    ).first()
+    if rolled_up_to is None:
+        return {}
+
+    moved = {}
+    # Walk floor by floor so each batch is read through the (floor, end_time) index
+    for floor_id in Floor.objects.order_by('pk').values_list('pk', flat=True):
+        eligible = Reservation.objects.filter(floor_id=floor_id, end_time__lt=cutoff, created_at__lte=rolled_up_to)
+        if dry_run:
+            moved[floor_id] = eligible.count()
+            continue
+
+        while True:
+            pks = list(eligible.order_by('end_time').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            archive_batch(pks)
+            moved[floor_id] = moved.get(floor_id, 0) + len(pks)
+    return {floor_id: count for floor_id, count in moved.items() if count}
@@ -0,0 +1,137 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import FloorJWTAuthentication, FloorTokenUser, claims_current, user_floor_id
+from .availability import SLOT, availability_index
+from .caching import aget_version, etag_matches
+from .models import Individual, Reservation
+from .serializers import ReservationSerializer
+from .views import (
+    in_listing_window, listing_window, reservation_list_etag, reservation_list_namespace, visible_reservations
+)
+
+MAX_RESULTS = 1000
+
+
+class NotAuthenticated(Exception):
+    def __init__(self, detail):
+        self.detail = detail
+
+
+async def aauthenticate(request):
+    """
+    Validate the request's JWT without leaving the event loop.
+
+    Safe requests get a stateless user from the token's claims, like FloorJWTAuthentication;
+    otherwise the active user and their room are loaded with aget().
+    """
+    authentication = FloorJWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise NotAuthenticated({'detail': "Authentication credentials were not provided."})
+
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except AuthenticationFailed as exc:
+        raise NotAuthenticated(exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail})
+
+    if request.method in SAFE_METHODS and claims_current(token):
+        return FloorTokenUser(token)
+
+    try:
+        user = await Individual.objects.select_related('room').aget(
+            **{api_settings.USER_ID_FIELD: token[api_settings.USER_ID_CLAIM]}
+        )
+    except (KeyError, Individual.DoesNotExist):
+        raise NotAuthenticated({'detail': "User not found", 'code': 'user_not_found'})
+    if not user.is_active:
+        raise NotAuthenticated({'detail': "User is inactive", 'code': 'user_inactive'})
+    return user
+
+
+def error_response(detail, status):
+    return JsonResponse(detail if isinstance(detail, dict) else {'detail': detail}, status=status)
+
+
+@require_safe
+async def reservation_list(request):
+    """
+    Async counterpart of GET /api/reservations/, limited to one window instead of paginated.
+
+    The body is {"results": [...], "truncated": bool} with no cursor: at most MAX_RESULTS
+    reservations of the ?from=/?to= window are returned, and truncated tells the client
+    to narrow the window rather than follow a next page.
+    """
+    try:
+        user = await aauthenticate(request)
+    except NotAuthenticated as exc:
+        return error_response(exc.detail, 401)
+
+    floor_id = user_floor_id(user)
+    if floor_id is None:
+        return JsonResponse({'results': []})
+
+    try:
+        window = listing_window(request.GET)
+    except ValidationError as exc:
+        return error_response(exc.detail, 400)
+
+    namespace = reservation_list_namespace(user, floor_id)
+    etag = reservation_list_etag(request, namespace, await aget_version(namespace))
+    if etag_matches(request, etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    queryset = in_listing_window(visible_reservations(user, floor_id), *window).order_by('reservation_time', 'id')
+    reservations = [reservation async for reservation in queryset[:MAX_RESULTS + 1]]
+    truncated = len(reservations) > MAX_RESULTS
+    response = JsonResponse({
+        'results': ReservationSerializer(reservations[:MAX_RESULTS], many=True).data,
+        'truncated': truncated,
+    })
+    response['ETag'] = etag
+    return response
+
+
+@require_safe
+async def reservation_detail(request, pk):
+    try:
+        user = await aauthenticate(request)
+    except NotAuthenticated as exc:
+        return error_response(exc.detail, 401)
+
+    try:
+        reservation = await visible_reservations(user, user_floor_id(user)).aget(pk=pk)
+    except Reservation.DoesNotExist:
+        return error_response("Not found.", 404)
+    return JsonResponse(ReservationSerializer(reservation).data)
+
+
+@require_safe
+async def floor_availability(request, floor_id):
+    """Async counterpart of GET /api/floors/{id}/availability/."""
+    try:
+        await aauthenticate(request)
+    except NotAuthenticated as exc:
+        return error_response(exc.detail, 401)
+
+    # Served straight from memory when warm; only a cold build needs the sync ORM
+    floor = await availability_index.acached(floor_id)
+    if floor is None:
+        floor = await sync_to_async(availability_index.get)(floor_id)
+    if floor is None:
+        return error_response("Not found.", 404)
+
+    return JsonResponse({
+        'floor': floor.floor_id,
+        'window_start': floor.window_start.isoformat(),
+        'window_end': floor.window_end.isoformat(),
+        'slot_minutes': int(SLOT.total_seconds() // 60),
+        'free': [{'start': start.isoformat(), 'end': end.isoformat()} for start, end in floor.free_ranges()],
+    })
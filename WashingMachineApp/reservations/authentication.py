@@ -0,0 +1,111 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils.functional import cached_property
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .caching import get_cache
+
+# When the room/floor/staff claims were read from the database; refreshing re-reads them
+CLAIMS_ISSUED_AT = 'claims_iat'
+
+
+def claims_max_age():
+    """How long claims are trusted before reads fall back to loading the user."""
+    return getattr(settings, 'RESERVATION_CLAIMS_MAX_AGE', timedelta(minutes=15)).total_seconds()
+
+
+def add_user_claims(token, user):
+    token['room_id'] = user.room_id
+    token['floor_id'] = user.room.floor_id if user.room_id else None
+    token['is_staff'] = user.is_staff
+    token[CLAIMS_ISSUED_AT] = time.time()
+    return token
+
+
+class FloorAccessToken(AccessToken):
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class FloorRefreshToken(RefreshToken):
+    """Refresh token carrying the user's room, floor and staff flag; refreshed access tokens re-read them."""
+    access_token_class = FloorAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+def revocation_key(user_id):
+    return f'auth:claims-revoked-before:{user_id}'
+
+
+def revoke_claims(user_ids):
+    """Stop trusting the claims of tokens already issued to these users; they fall back to a database lookup."""
+    if user_ids:
+        # Older claims are not trusted anyway, so the marker only has to outlive the max age
+        timeout = int(claims_max_age()) + 1
+        revoked_at = time.time()
+        get_cache().set_many({revocation_key(user_id): revoked_at for user_id in user_ids}, timeout)
+
+
+def claims_current(token):
+    if CLAIMS_ISSUED_AT not in token:
+        return False  # Issued before the claims existed
+    if time.time() - token[CLAIMS_ISSUED_AT] > claims_max_age():
+        return False  # Too old to trust: revocation markers are per cache and may have been lost
+    revoked_at = get_cache().get(revocation_key(token[api_settings.USER_ID_CLAIM]))
+    return revoked_at is None or token[CLAIMS_ISSUED_AT] > revoked_at
+
+
+class FloorTokenUser(TokenUser):
+    """Stateless user built from a token's claims."""
+
+    @cached_property
+    def room_id(self):
+        return self.token.get('room_id')
+
+    @cached_property
+    def floor_id(self):
+        return self.token.get('floor_id')
+
+
+def user_floor_id(user):
+    """Return the floor of the user's room, or None; stateless users answer from their token."""
+    if isinstance(user, FloorTokenUser):
+        return user.floor_id
+    return user.room.floor_id if user.room_id else None
+
+
+class FloorJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that answers safe requests from the token alone.
+
+    GET/HEAD/OPTIONS get a FloorTokenUser, so reads cost no user query. Writes, tokens
+    whose claims are older than RESERVATION_CLAIMS_MAX_AGE, and tokens whose claims were
+    revoked by a change to the user or their room still load the Individual from the database.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_request_user(request, validated_token), validated_token
+
+    def get_request_user(self, request, validated_token):
+        if request.method in SAFE_METHODS and claims_current(validated_token):
+            return FloorTokenUser(validated_token)
+        return self.get_user(validated_token)
@@ -0,0 +1,184 @@
+import threading
+from array import array
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .caching import aget_version, get_version, reservation_namespace
+from .models import Floor, Reservation
+from .validation import BUCHAREST_TZ, END_OF_DAY, START_OF_DAY, booking_window
+
+SLOT = timedelta(minutes=10)
+
+
+class FloorAvailability:
+    """
+    Occupancy counters for one floor, one entry per 10-minute slot of the booking window.
+
+    A slot is free when its counter is zero. Counters rather than bits keep deletes
+    correct when two back-to-back reservations share a partially used slot, and the
+    slot range of every reservation is remembered so updates and deletes only need its id.
+    """
+
+    def __init__(self, floor_id, window_start, window_end, version=None):
+        self.floor_id = floor_id
+        self.window_start = window_start
+        self.window_end = window_end
+        self.version = version  # The floor's reservation feed version when it was loaded
+        self.slot_count = int((window_end - window_start) / SLOT)
+        self.busy = array('H', bytes(2 * self.slot_count))
+        self.bookable = self._bookable_mask()
+        self.reservations = {}  # Reservation id -> (first slot, last slot)
+        self._free_runs = None
+
+    def _bookable_mask(self):
+        """Mark the slots inside working hours on days other than Sunday."""
+        opening = START_OF_DAY.hour * 60 + START_OF_DAY.minute
+        closing = END_OF_DAY.hour * 60 + END_OF_DAY.minute
+        slot_minutes = int(SLOT.total_seconds() // 60)
+        mask = array('B', bytes(self.slot_count))
+        for index in range(self.slot_count):
+            local = (self.window_start + index * SLOT).astimezone(BUCHAREST_TZ)
+            minute_of_day = local.hour * 60 + local.minute
+            if local.weekday() != 6 and opening <= minute_of_day and minute_of_day + slot_minutes <= closing:
+                mask[index] = 1
+        return mask
+
+    def _slot_range(self, start, end):
+        first = max(0, int((start - self.window_start) // SLOT))
+        last = min(self.slot_count, -int(-(end - self.window_start) // SLOT))  # Round up partial slots
+        return first, last
+
+    def _apply(self, first, last, delta):
+        for index in range(first, last):
+            self.busy[index] += delta
+        if first < last:
+            self._free_runs = None
+
+    def put(self, reservation_id, start, end):
+        """Insert or move a reservation; calling it twice with the same values is a no-op."""
+        self.discard(reservation_id)
+        first, last = self._slot_range(start, end)
+        self.reservations[reservation_id] = (first, last)
+        self._apply(first, last, 1)
+
+    def discard(self, reservation_id):
+        slots = self.reservations.pop(reservation_id, None)
+        if slots is not None:
+            self._apply(*slots, -1)
+
+    def free_runs(self):
+        """Return (first_slot, last_slot) runs of consecutive free, bookable slots."""
+        if self._free_runs is None:
+            runs = []
+            run_start = None
+            for index in range(self.slot_count):
+                free = self.bookable[index] and not self.busy[index]
+                if free and run_start is None:
+                    run_start = index
+                elif not free and run_start is not None:
+                    runs.append((run_start, index))
+                    run_start = None
+            if run_start is not None:
+                runs.append((run_start, self.slot_count))
+            self._free_runs = runs
+        return self._free_runs
+
+    def free_ranges(self, now=None):
+        """Return the free (start, end) datetimes from now until the end of the window."""
+        now_slot = int(((now or timezone.now()) - self.window_start) // SLOT)
+        ranges = []
+        for first, last in self.free_runs():
+            if last <= now_slot:
+                continue
+            first = max(first, now_slot)
+            ranges.append((self.window_start + first * SLOT, self.window_start + last * SLOT))
+        return ranges
+
+
+def is_current(floor, window_start, version):
+    return floor is not None and floor.window_start == window_start and floor.version == version
+
+
+class AvailabilityIndex:
+    """
+    Process-wide cache of FloorAvailability objects.
+
+    A floor is rebuilt when the booking window moves or its reservation feed version
+    changes. Signals only reach the process that wrote, so the shared version is what
+    tells the other workers their copy is stale.
+    """
+
+    def __init__(self):
+        self._floors = {}
+        self._lock = threading.Lock()
+
+    def get(self, floor_id):
+        """Return the floor's availability, building it from the database on first use, or None."""
+        window_start, window_end = booking_window()
+        # Read before loading, so a change committed during the build bumps it past this one
+        version = get_version(reservation_namespace(floor_id))
+        with self._lock:
+            floor = self._floors.get(floor_id)
+            if is_current(floor, window_start, version):
+                return floor
+
+            # Build while holding the lock so committed changes that arrive meanwhile are applied on top
+            if not Floor.objects.filter(pk=floor_id).exists():
+                return None
+
+            floor = FloorAvailability(floor_id, window_start, window_end, version)
+            reservations = Reservation.objects.filter(
+                floor_id=floor_id,
+                reservation_time__lt=window_end,
+                end_time__gt=window_start
+            ).values_list('pk', 'reservation_time', 'end_time')
+            for reservation_id, start, end in reservations:
+                floor.put(reservation_id, start, end)
+
+            self._floors[floor_id] = floor
+            return floor
+
+    def cached(self, floor_id):
+        """Return the floor's availability if it is already built for the current window, or None."""
+        return self._current(floor_id, get_version(reservation_namespace(floor_id)))
+
+    async def acached(self, floor_id):
+        """Async counterpart of cached(), reading the version through the cache's async API."""
+        return self._current(floor_id, await aget_version(reservation_namespace(floor_id)))
+
+    def _current(self, floor_id, version):
+        window_start, _ = booking_window()
+        with self._lock:
+            floor = self._floors.get(floor_id)
+        return floor if is_current(floor, window_start, version) else None
+
+    def put(self, floor_id, reservation_id, start, end):
+        with self._lock:
+            for floor in self._floors.values():
+                if floor.floor_id == floor_id:
+                    floor.put(reservation_id, start, end)
+                else:
+                    floor.discard(reservation_id)
+
+    def discard(self, reservation_id):
+        with self._lock:
+            for floor in self._floors.values():
+                floor.discard(reservation_id)
+
+    def advance(self, versions):
+        """
+        Re-stamp floors with the version their own write bumped them to.
+
+        Takes {floor id: (old, new version)} from reservation_feeds_changed(). A floor is
+        only re-stamped if it was current before the bump, so a change made elsewhere in
+        the meantime still forces a rebuild.
+        """
+        with self._lock:
+            for floor_id, (previous, version) in versions.items():
+                floor = self._floors.get(floor_id)
+                if floor is not None and floor.version == previous:
+                    floor.version = version
+
+
+availability_index = AvailabilityIndex()
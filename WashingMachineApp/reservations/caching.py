@@ -0,0 +1,103 @@
+import hashlib
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+REFERENCE_DATA = 'reference'
+ALL_RESERVATIONS = 'reservations:all'
+
+
+def reservation_namespace(floor_id):
+    """Version namespace of one floor's reservation feed."""
+    return f'reservations:floor:{floor_id}'
+
+
+def get_cache():
+    """Return the cache backend selected by RESERVATIONS_CACHE_ALIAS (the default cache if unset)."""
+    return caches[getattr(settings, 'RESERVATIONS_CACHE_ALIAS', 'default')]
+
+
+def get_version(namespace):
+    """Return the current version token of a namespace, creating one if the cache has none."""
+    cache = get_cache()
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        # A fresh random token invalidates anything cached under an evicted version
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+async def aget_version(namespace):
+    """Async counterpart of get_version(), going through the cache's async API."""
+    cache = get_cache()
+    key = f'version:{namespace}'
+    version = await cache.aget(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not await cache.aadd(key, version, timeout=None):
+            version = await cache.aget(key, version)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate everything cached under a namespace and return its new version token."""
+    version = uuid.uuid4().hex
+    get_cache().set(f'version:{namespace}', version, timeout=None)
+    return version
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def not_modified(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+class CachedReadMixin:
+    """
+    Serve list and retrieve responses from the cache, keyed by the namespace version.
+
+    Clients that send back the ETag get a 304 before the cache or the database is read.
+    """
+    cache_namespace = REFERENCE_DATA
+    cache_timeout = 60 * 60
+
+    def cached_response(self, request, build_response):
+        version = get_version(self.cache_namespace)
+        key = f'{self.cache_namespace}:{version}:{request.get_full_path()}'
+        etag = make_etag(key)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is None:
+            response = build_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, self.cache_timeout)
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, partial(super().list, request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, partial(super().retrieve, request, *args, **kwargs))
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """
+    A bounded event queue owned by one streaming connection.
+
+    When a slow client lets the queue fill up, the oldest event is dropped and the
+    subscription is flagged as lagging, so the stream can tell the client to resync
+    instead of buffering without limit.
+    """
+
+    def __init__(self, floor_id, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.floor_id = floor_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.lagging = False
+
+    def offer(self, event):
+        """Enqueue without blocking the publisher; must run on the subscriber's loop."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.lagging = True
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Return the next event, or None if nothing arrives within timeout seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class FloorEventBroker:
+    """In-process publish/subscribe of reservation events, one channel per floor."""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, floor_id, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        """Register a subscription; must be called from the event loop that will consume it."""
+        subscription = Subscription(floor_id, maxsize)
+        with self._lock:
+            self._subscribers[floor_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.floor_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.floor_id]
+
+    def publish(self, floor_id, event):
+        """Hand an event to every subscriber of the floor; safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(floor_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop is closed; the connection is gone
+                self.unsubscribe(subscription)
+
+
+broker = FloorEventBroker()
+
+
+def reservation_event(event_type, reservation):
+    return {
+        'type': event_type,
+        'id': str(reservation.pk),
+        'floor': reservation.floor_id,
+        'reservation_time': reservation.reservation_time.isoformat(),
+        'end_time': reservation.end_time.isoformat(),
+    }
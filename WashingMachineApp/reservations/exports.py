@@ -0,0 +1,71 @@
+import csv
+import json
+
+from .archive import reservation_history
+
+EXPORT_CHUNK_SIZE = 2000
+
+# Column name -> lookup, joined through room, floor and individual in the same query
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'floor': 'floor__floor_number',
+    'room': 'room__room_number',
+    'username': 'individual__username',
+    'first_name': 'individual__first_name',
+    'last_name': 'individual__last_name',
+    'reservation_time': 'reservation_time',
+    'end_time': 'end_time',
+    'duration_minutes': 'duration',
+    'created_at': 'created_at',
+}
+
+
+class Echo:
+    """File-like object whose write() returns the line instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(window_start=None, window_end=None, floor_id=None):
+    """Export columns of the live and archived reservations, in start order."""
+    filters = {}
+    if window_start is not None:
+        filters['reservation_time__gte'] = window_start
+    if window_end is not None:
+        filters['reservation_time__lt'] = window_end
+    if floor_id is not None:
+        filters['floor_id'] = floor_id
+    return reservation_history(EXPORT_COLUMNS.values(), **filters).order_by('reservation_time', 'id')
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one dict per reservation, streaming from the database in chunks."""
+    columns = list(EXPORT_COLUMNS)
+    for values in queryset.iterator(chunk_size=chunk_size):
+        row = dict(zip(columns, values))
+        row['id'] = str(row['id'])
+        row['reservation_time'] = row['reservation_time'].isoformat()
+        row['end_time'] = row['end_time'].isoformat()
+        row['created_at'] = row['created_at'].isoformat()
+        row['duration_minutes'] = int(row['duration_minutes'].total_seconds() // 60)
+        yield row
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(list(EXPORT_COLUMNS))
+    for row in rows:
+        yield writer.writerow(row.values())
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+# Format name -> (line generator, content type)
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,60 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from .models import Reservation
+
+
+class FloorIntervals:
+    """
+    The reservations of one floor as half-open [start, end) intervals sorted by start.
+
+    Overlap queries binary-search the start times and only walk back as far as the
+    longest stored interval, so a lookup costs O(log n) plus the few neighbours
+    inspected. Insertion binary-searches its position as well.
+    """
+
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._entries = []  # (start, end, key), parallel to _starts
+        self._longest = timedelta()
+        for start, end, key in sorted(intervals, key=lambda interval: interval[0]):
+            self._starts.append(start)
+            self._entries.append((start, end, key))
+            self._longest = max(self._longest, end - start)
+
+    @classmethod
+    def load(cls, floor_id, window_start, window_end, exclude_pk=None):
+        """Load the floor's reservations that touch [window_start, window_end) in one query."""
+        queryset = Reservation.objects.filter(
+            floor_id=floor_id,
+            reservation_time__lt=window_end,
+            end_time__gt=window_start
+        )
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        return cls(queryset.values_list('reservation_time', 'end_time', 'pk'))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def add(self, start, end, key=None):
+        index = bisect_right(self._starts, start)
+        self._starts.insert(index, start)
+        self._entries.insert(index, (start, end, key))
+        self._longest = max(self._longest, end - start)
+
+    def overlapping(self, start, end, exclude=None):
+        """Return the (start, end, key) entries overlapping [start, end)."""
+        # Nothing starting before start - longest can still be running at start
+        first = bisect_left(self._starts, start - self._longest)
+        last = bisect_left(self._starts, end)
+        return [
+            entry for entry in self._entries[first:last]
+            if entry[1] > start and (exclude is None or entry[2] != exclude)
+        ]
+
+    def overlaps(self, start, end, exclude=None):
+        return bool(self.overlapping(start, end, exclude))
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import DatabaseError, OperationalError, connection, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Floor
+
+LOCK_RETRIES = 5
+LOCK_RETRY_DELAY = 0.05  # Seconds, doubled after every failed attempt
+LOCK_TIMEOUT = 2.0  # Seconds to wait for a floor lock before retrying
+
+# Errors raised while another connection holds a lock this one needs
+SQLITE_LOCK_ERRORS = {sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED}
+POSTGRESQL_LOCK_NOT_AVAILABLE = '55P03'
+
+# In-process locks used when the database has no row-level locking (SQLite)
+_local_floor_locks = defaultdict(threading.Lock)
+_local_floor_locks_guard = threading.Lock()
+
+
+class FloorBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The washing machine on this floor is being booked by someone else. Please try again."
+    default_code = 'floor_busy'
+
+
+class FloorLockUnavailable(Exception):
+    """Raised when a floor lock could not be taken without waiting."""
+
+
+def set_lock_timeout(seconds=None):
+    """Set PostgreSQL's lock_timeout for the rest of the current transaction; None restores the default."""
+    with connection.cursor() as cursor:
+        if seconds is None:
+            cursor.execute("SET LOCAL lock_timeout TO DEFAULT")
+        else:
+            # set_config(..., true) is SET LOCAL with the value passed as a query parameter
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f'{int(seconds * 1000)}ms'])
+
+
+def is_lock_contention(exc):
+    """Return True if the database error reports a lock held by another connection."""
+    if not isinstance(exc, OperationalError):
+        return False
+    cause = exc.__cause__
+    if isinstance(cause, sqlite3.OperationalError):
+        # Extended result codes keep the primary code in the low byte
+        return getattr(cause, 'sqlite_errorcode', 0) & 0xff in SQLITE_LOCK_ERRORS
+    return getattr(cause, 'sqlstate', getattr(cause, 'pgcode', None)) == POSTGRESQL_LOCK_NOT_AVAILABLE
+
+
+@contextmanager
+def floor_lock(floor_id):
+    """
+    Serialise bookings on a floor for the duration of a transaction.
+
+    On PostgreSQL the floor row is locked with a blocking SELECT ... FOR UPDATE,
+    so bookings queue for the lock, waiting at most LOCK_TIMEOUT. Other databases
+    with row locking use FOR UPDATE NOWAIT where supported. SQLite has no row
+    locks, so an in-process lock per floor is held instead while the transaction runs.
+    """
+    if connection.features.has_select_for_update:
+        lock_timeout = connection.vendor == 'postgresql'
+        nowait = not lock_timeout and connection.features.has_select_for_update_nowait
+        with transaction.atomic():
+            try:
+                if lock_timeout:
+                    set_lock_timeout(LOCK_TIMEOUT)
+                list(Floor.objects.select_for_update(nowait=nowait).filter(pk=floor_id).values_list('pk'))
+                if lock_timeout:
+                    # Only the floor lock gives up early; the booking itself waits as usual
+                    set_lock_timeout()
+            except DatabaseError as exc:
+                raise FloorLockUnavailable(floor_id) from exc
+            yield
+        return
+
+    with _local_floor_locks_guard:
+        local_lock = _local_floor_locks[floor_id]
+    if not local_lock.acquire(timeout=LOCK_TIMEOUT):
+        raise FloorLockUnavailable(floor_id)
+    try:
+        with transaction.atomic():
+            yield
+    finally:
+        local_lock.release()
+
+
+def run_with_floor_lock(floor_id, func):
+    """Call func while holding the floor lock, retrying a bounded number of times on contention."""
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with floor_lock(floor_id):
+                return func()
+        except FloorLockUnavailable:
+            pass
+        except OperationalError as exc:
+            # SQLite reports a busy writer as SQLITE_BUSY or, with a shared cache, SQLITE_LOCKED
+            if not is_lock_contention(exc):
+                raise
+        time.sleep(LOCK_RETRY_DELAY * (2 ** attempt))
+    raise FloorBusy()
@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from reservations.allocation import allocate_week, request_week
+from reservations.models import AllocationRun
+
+
+class Command(BaseCommand):
+    help = "Allocate a week's ranked slot preferences floor by floor and create the reservations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--week', help="Monday of the week to allocate (YYYY-MM-DD); defaults to next week.")
+        parser.add_argument('--dry-run', action='store_true', help="Report the outcome and roll back.")
+
+    def handle(self, *args, **options):
+        if options['week']:
+            try:
+                week_start = date.fromisoformat(options['week'])
+            except ValueError:
+                raise CommandError("--week must be a date in YYYY-MM-DD format.")
+            if week_start.weekday() != 0:
+                raise CommandError("--week must be a Monday.")
+        else:
+            week_start = request_week()
+
+        if AllocationRun.objects.filter(week_start=week_start).exists():
+            raise CommandError(f"The week of {week_start} has already been allocated.")
+
+        try:
+            with transaction.atomic():
+                run = allocate_week(week_start)
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+        except IntegrityError:
+            raise CommandError(f"The week of {week_start} has already been allocated.")
+
+        prefix = "Dry run, nothing saved" if options['dry_run'] else "Allocated"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}: week of {week_start}, {run.allocated} preference(s) granted, {run.rejected} rejected."
+        ))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reservations.archive import ARCHIVE_BATCH_SIZE, archive_cutoff, archive_reservations, archive_weeks
+from reservations.models import RollupWatermark
+from reservations.signals import reservation_feeds_changed
+
+
+class Command(BaseCommand):
+    help = "Move reservations that ended more than N weeks ago into the reservation archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weeks', type=int,
+            help="Archive reservations that ended before the week N weeks back; defaults to RESERVATION_ARCHIVE_WEEKS."
+        )
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Count what would be archived without moving it.")
+
+    def handle(self, *args, **options):
+        weeks = archive_weeks() if options['weeks'] is None else options['weeks']
+        if weeks < 0:
+            raise CommandError("--weeks can't be negative.")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if not RollupWatermark.objects.filter(name=RollupWatermark.FLOOR_USAGE, rolled_up_to__isnull=False).exists():
+            raise CommandError("Run refresh_usage_rollups first; only rolled up reservations are archived.")
+
+        cutoff = archive_cutoff(weeks)
+        moved = archive_reservations(cutoff, options['batch_size'], options['dry_run'])
+        total = sum(moved.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f"Dry run: {total} reservation(s) that ended before {cutoff} would be archived."
+            ))
+            return
+
+        # List responses may have included the archived rows
+        reservation_feeds_changed(moved)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} reservation(s) that ended before {cutoff} from {len(moved)} floor(s)."
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from reservations.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_queryset, export_rows
+from reservations.validation import parse_window_bound
+
+
+class Command(BaseCommand):
+    help = "Stream reservation history as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write to instead of standard output.")
+        parser.add_argument('--from', dest='window_start', help="ISO date or datetime to start from.")
+        parser.add_argument('--to', dest='window_end', help="ISO date or datetime to stop before.")
+        parser.add_argument('--floor', type=int, help="Only export reservations on this floor id.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            window_start = options['window_start'] and parse_window_bound(options['window_start'], 'from')
+            window_end = options['window_end'] and parse_window_bound(options['window_end'], 'to')
+        except ValidationError as exc:
+            raise CommandError('; '.join(f"--{field}: {message}" for field, message in exc.detail.items()))
+
+        queryset = export_queryset(window_start or None, window_end or None, options['floor'])
+        iter_lines, _ = EXPORT_FORMATS[options['format']]
+        lines = iter_lines(export_rows(queryset, chunk_size=options['chunk_size']))
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as handle:
+                handle.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,236 @@
+import csv
+import json
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from reservations.caching import REFERENCE_DATA, bump_version
+from reservations.models import Floor, Room, Individual
+
+RESIDENT_FIELDS = ('username', 'email', 'first_name', 'last_name', 'national_id', 'country')
+
+
+class RowError(Exception):
+    pass
+
+
+def iter_csv(handle):
+    yield from csv.DictReader(handle)
+
+
+def iter_json_lines(handle):
+    for line in handle:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_array(handle, chunk_size=65536):
+    """Yield the objects of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = handle.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != '[':
+                    raise CommandError("A .json import file must contain a top-level array.")
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[:1] in (',', ']'):
+                if buffer[0] == ']':
+                    return
+                buffer = buffer[1:]
+                continue
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break  # Incomplete object, read more
+            yield record
+            buffer = buffer[end:]
+        if not chunk:
+            if started:
+                raise CommandError("Unexpected end of JSON array.")
+            return
+
+
+READERS = {
+    '.csv': iter_csv,
+    '.jsonl': iter_json_lines,
+    '.ndjson': iter_json_lines,
+    '.json': iter_json_array,
+}
+
+
+def parse_rows(records):
+    """Normalise raw records, yielding (line, row) on success or (line, RowError) on failure."""
+    for line, record in enumerate(records, start=1):
+        try:
+            floor_number = int(record['floor_number'])
+            room_number = int(record['room_number'])
+            max_occupants = int(record.get('max_occupants') or 2)
+        except (KeyError, TypeError, ValueError):
+            yield line, RowError("floor_number and room_number must be integers.")
+            continue
+
+        # Same prefix rule as Room.clean, checked without touching the database
+        room_number_str = str(room_number).zfill(3)
+        if not room_number_str.startswith(str(floor_number)):
+            yield line, RowError(f"Room number {room_number_str} does not match Floor {floor_number}.")
+            continue
+
+        resident = {field: (record.get(field) or '').strip() or None for field in RESIDENT_FIELDS}
+        yield line, {
+            'floor_number': floor_number,
+            'room_number': room_number,
+            'max_occupants': max_occupants,
+            'resident': resident if resident['username'] else None,
+        }
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Import floors, rooms and residents from a CSV, JSON array or JSON-lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File with floor_number, room_number, max_occupants and resident columns.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and roll back instead of committing.")
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f"Unsupported file type '{path.suffix}'. Use one of: {', '.join(READERS)}.")
+
+        self.unusable_password = make_password(None)
+        self.stats = {'floors': 0, 'rooms': 0, 'individuals': 0, 'errors': 0}
+
+        with path.open(newline='', encoding='utf-8') as handle, transaction.atomic():
+            self.load_existing()
+            for batch in batched(parse_rows(reader(handle)), options['batch_size']):
+                self.import_batch(batch)
+
+            if self.stats['floors'] or self.stats['rooms']:
+                # bulk_create() sends no post_save, so invalidate the cached floor and room lists here
+                transaction.on_commit(lambda: bump_version(REFERENCE_DATA))
+
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        summary = ', '.join(f"{count} {name}" for name, count in self.stats.items())
+        prefix = "Dry run, nothing saved" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(f"{prefix}: {summary}."))
+
+    def load_existing(self):
+        """Precompute floor ids, room ids, capacities and occupant counts once."""
+        self.floor_ids = dict(Floor.objects.values_list('floor_number', 'id'))
+        self.rooms = {}  # (floor_number, room_number) -> [room id, max occupants, occupants]
+        rooms = Room.objects.annotate(occupants=Count('individual')).values_list(
+            'floor__floor_number', 'room_number', 'id', 'max_occupants', 'occupants'
+        )
+        for floor_number, room_number, room_id, max_occupants, occupants in rooms:
+            self.rooms[(floor_number, room_number)] = [room_id, max_occupants, occupants]
+        self.seen = {field: set() for field in ('username', 'email', 'national_id')}
+
+    def report(self, line, message):
+        self.stats['errors'] += 1
+        self.stderr.write(f"Row {line}: {message}")
+
+    def import_batch(self, batch):
+        rows = []
+        for line, row in batch:
+            if isinstance(row, RowError):
+                self.report(line, row)
+            else:
+                rows.append((line, row))
+
+        # Floors and rooms first, so residents can reference their ids
+        new_floors = {row['floor_number'] for _, row in rows} - self.floor_ids.keys()
+        if new_floors:
+            Floor.objects.bulk_create([Floor(floor_number=number) for number in sorted(new_floors)])
+            self.floor_ids.update(Floor.objects.filter(floor_number__in=new_floors).values_list('floor_number', 'id'))
+            self.stats['floors'] += len(new_floors)
+
+        new_rooms = {}
+        for _, row in rows:
+            key = (row['floor_number'], row['room_number'])
+            if key not in self.rooms and key not in new_rooms:
+                new_rooms[key] = Room(
+                    floor_id=self.floor_ids[row['floor_number']],
+                    room_number=row['room_number'],
+                    max_occupants=row['max_occupants'],
+                )
+        if new_rooms:
+            Room.objects.bulk_create(new_rooms.values())
+            created = Room.objects.filter(
+                floor_id__in={room.floor_id for room in new_rooms.values()},
+                room_number__in={room.room_number for room in new_rooms.values()},
+            ).values_list('floor__floor_number', 'room_number', 'id', 'max_occupants')
+            for floor_number, room_number, room_id, max_occupants in created:
+                self.rooms.setdefault((floor_number, room_number), [room_id, max_occupants, 0])
+            self.stats['rooms'] += len(new_rooms)
+
+        residents = [(line, row) for line, row in rows if row['resident']]
+        if not residents:
+            return
+
+        # One query per batch for residents that already exist in the database
+        taken = {field: set() for field in self.seen}
+        existing = Individual.objects.filter(
+            username__in=[row['resident']['username'] for _, row in residents]
+        ).values_list('username', flat=True)
+        taken['username'].update(existing)
+        for field in ('email', 'national_id'):
+            values = [row['resident'][field] for _, row in residents if row['resident'][field]]
+            taken[field].update(Individual.objects.filter(**{f'{field}__in': values}).values_list(field, flat=True))
+
+        individuals = []
+        for line, row in residents:
+            resident = row['resident']
+            duplicate = next(
+                (field for field in taken if resident[field] and (
+                    resident[field] in taken[field] or resident[field] in self.seen[field])),
+                None
+            )
+            if duplicate:
+                self.report(line, f"{duplicate} '{resident[duplicate]}' is already registered.")
+                continue
+
+            room = self.rooms[(row['floor_number'], row['room_number'])]
+            if room[2] >= room[1]:
+                self.report(line, f"Room {row['room_number']} cannot have more than {room[1]} occupants.")
+                continue
+
+            room[2] += 1
+            for field in self.seen:
+                if resident[field]:
+                    self.seen[field].add(resident[field])
+            individuals.append(Individual(
+                room_id=room[0],
+                password=self.unusable_password,
+                is_active=False,
+                email=resident['email'] or '',
+                first_name=resident['first_name'] or '',
+                last_name=resident['last_name'] or '',
+                username=resident['username'],
+                national_id=resident['national_id'],
+                country=resident['country'],
+            ))
+
+        Individual.objects.bulk_create(individuals)
+        self.stats['individuals'] += len(individuals)
@@ -0,0 +1,60 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservations.archive import reservation_history
+from reservations.models import RoomWeeklyUsage, usage_minutes
+from reservations.usage import usage_key
+
+
+class Command(BaseCommand):
+    help = "Rebuild the weekly usage counters from the reservations and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without changing the counters.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # Lock the counters before reading reservations: bookings that commit meanwhile
+            # wait on the lock and then increment the rebuilt value
+            stored = {
+                (counter.room_id, counter.week_start): counter
+                for counter in RoomWeeklyUsage.objects.select_for_update()
+            }
+
+            expected = Counter()
+            # Archived reservations still count towards their weeks
+            reservations = reservation_history(('room_id', 'reservation_time', 'duration'))
+            for room_id, reservation_time, duration in reservations.iterator(chunk_size=2000):
+                expected[usage_key(room_id, reservation_time)] += usage_minutes(duration)
+
+            changed, missing, stale = [], [], []
+            for key in sorted(expected.keys() | stored.keys()):
+                minutes = expected.get(key, 0)
+                counter = stored.get(key)
+                current = counter.reserved_minutes if counter else 0
+                if current == minutes:
+                    continue
+
+                room_id, week_start = key
+                self.stdout.write(f"Room {room_id}, week of {week_start}: stored {current} min, expected {minutes} min.")
+                if counter is None:
+                    missing.append(RoomWeeklyUsage(room_id=room_id, week_start=week_start, reserved_minutes=minutes))
+                elif minutes == 0:
+                    stale.append(counter.pk)
+                else:
+                    counter.reserved_minutes = minutes
+                    changed.append(counter)
+
+            drift = len(changed) + len(missing) + len(stale)
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING(f"Dry run: {drift} counter(s) drifted, nothing changed."))
+                return
+
+            RoomWeeklyUsage.objects.bulk_update(changed, ['reserved_minutes'], batch_size=1000)
+            RoomWeeklyUsage.objects.bulk_create(missing, batch_size=1000)
+            RoomWeeklyUsage.objects.filter(pk__in=stale).delete()
+
+        style = self.style.WARNING if drift else self.style.SUCCESS
+        self.stdout.write(style(f"Reconciled {len(expected)} counter(s); {drift} had drifted and were rebuilt."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from reservations.rollups import refresh_floor_usage
+
+
+class Command(BaseCommand):
+    help = "Roll reservations created since the last refresh into the floor usage rollup."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Discard the rollup and rebuild it from all reservations.")
+
+    def handle(self, *args, **options):
+        watermark, rolled_up = refresh_floor_usage(rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {rolled_up} reservation(s); the rollup now covers bookings made up to {watermark.rolled_up_to}."
+        ))
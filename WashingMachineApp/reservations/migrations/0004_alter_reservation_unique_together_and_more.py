@@ -0,0 +1,87 @@
+# Generated by Django 5.1.1 on 2026-10-16 20:32
+
+import datetime
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def populate_individual(apps, schema_editor):
+    # Older reservations only recorded the room; credit each one to the room's first occupant
+    Individual = apps.get_model(settings.AUTH_USER_MODEL)
+    Reservation = apps.get_model('reservations', 'Reservation')
+    occupant = Individual.objects.filter(room_id=OuterRef('room_id')).order_by('pk').values('pk')[:1]
+    Reservation.objects.filter(individual__isnull=True).update(individual_id=Subquery(occupant))
+    # A reservation of an empty room has nobody who could manage or cancel it
+    Reservation.objects.filter(individual__isnull=True).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Fire the deferred foreign key checks now, so the ALTER TABLEs below can run in this transaction
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0003_alter_individual_country'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='reservation',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='individual',
+            name='admin_floor',
+            field=models.IntegerField(blank=True, help_text='The floor this user administers.', null=True),
+        ),
+        migrations.AddField(
+            model_name='individual',
+            name='validated_email',
+            field=models.BooleanField(default=False, help_text="Set to true when the user's email is verified"),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='duration',
+            field=models.DurationField(default=datetime.timedelta(seconds=2400)),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='floor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='reservations.floor'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='individual',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(populate_individual, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reservation',
+            name='individual',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='id',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='floor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.floor'),
+        ),
+        migrations.RemoveField(
+            model_name='reservation',
+            name='washing_machine_room',
+        ),
+    ]
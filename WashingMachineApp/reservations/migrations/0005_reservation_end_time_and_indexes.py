@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+
+def populate_end_time(apps, schema_editor):
+    Reservation = apps.get_model('reservations', 'Reservation')
+    for reservation in Reservation.objects.select_related('room').iterator(chunk_size=2000):
+        reservation.end_time = reservation.reservation_time + reservation.duration
+        if reservation.floor_id is None:
+            reservation.floor_id = reservation.room.floor_id
+        reservation.save(update_fields=['end_time', 'floor'])
+    if schema_editor.connection.vendor == 'postgresql':
+        # Fire the deferred foreign key checks now, so the ALTER TABLEs below can run in this transaction
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0004_alter_reservation_unique_together_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='end_time',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(populate_end_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reservation',
+            name='end_time',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['floor', 'reservation_time'], name='reservation_floor_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['room', 'reservation_time'], name='reservation_room_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['floor', 'end_time'], name='reservation_floor_end_idx'),
+        ),
+    ]
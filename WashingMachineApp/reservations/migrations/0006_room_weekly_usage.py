@@ -0,0 +1,50 @@
+# Generated by Django 5.1.1 on 2026-10-16 20:48
+
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+import pytz
+from django.db import migrations, models
+
+
+def populate_weekly_usage(apps, schema_editor):
+    Reservation = apps.get_model('reservations', 'Reservation')
+    RoomWeeklyUsage = apps.get_model('reservations', 'RoomWeeklyUsage')
+    bucharest_tz = pytz.timezone('Europe/Bucharest')
+
+    totals = Counter()
+    reservations = Reservation.objects.values_list('room_id', 'reservation_time', 'duration')
+    for room_id, reservation_time, duration in reservations.iterator(chunk_size=2000):
+        local_date = reservation_time.astimezone(bucharest_tz).date()
+        week_start = local_date - timedelta(days=local_date.weekday())
+        totals[room_id, week_start] += -int(-duration.total_seconds() // 60)  # Whole minutes, rounded up
+
+    RoomWeeklyUsage.objects.bulk_create(
+        [RoomWeeklyUsage(room_id=room_id, week_start=week_start, reserved_minutes=minutes)
+         for (room_id, week_start), minutes in totals.items()],
+        batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0005_reservation_end_time_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomWeeklyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('reserved_minutes', models.IntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.room')),
+            ],
+            options={
+                'unique_together': {('room', 'week_start')},
+            },
+        ),
+        migrations.RunPython(populate_weekly_usage, migrations.RunPython.noop),
+    ]
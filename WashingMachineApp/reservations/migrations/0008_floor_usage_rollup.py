@@ -0,0 +1,46 @@
+# Generated by Django 5.1.1 on 2026-10-16 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0007_slot_preferences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FloorHourlyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week_start', models.DateField()),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('reserved_seconds', models.IntegerField(default=0)),
+                ('reservations', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('rolled_up_to', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['created_at'], name='reservation_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='floorhourlyusage',
+            name='floor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.floor'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='floorhourlyusage',
+            unique_together={('floor', 'week_start', 'hour')},
+        ),
+    ]
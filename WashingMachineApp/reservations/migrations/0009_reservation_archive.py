@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-16 21:05
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservations', '0008_floor_usage_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('reservation_time', models.DateTimeField()),
+                ('duration', models.DurationField()),
+                ('created_at', models.DateTimeField()),
+                ('end_time', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+                ('floor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='reservations.floor')),
+                ('individual', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservations.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['floor', 'reservation_time'], name='archive_floor_time_idx'), models.Index(fields=['room', 'reservation_time'], name='archive_room_time_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,8 @@
 from base64 import encode
 import uuid
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Now
 from django.core.exceptions import ValidationError
 from django_countries.fields import CountryField
 from datetime import timedelta, time
@@ -105,11 +106,48 @@ class Reservation(models.Model):
     duration = models.DurationField(default=timedelta(minutes=40))  # Default to 40-minute intervals
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp for when the reservation is created
     floor = models.ForeignKey(Floor, on_delete=models.SET_NULL, null=True, blank=True)
+    end_time = models.DateTimeField(editable=False)  # Stored reservation_time + duration, kept in sync by save()
+
+    class Meta:
+        indexes = [
+            # Floor listings and time-window lookups
+            models.Index(fields=['floor', 'reservation_time'], name='reservation_floor_time_idx'),
+            # Weekly quota lookups per room
+            models.Index(fields=['room', 'reservation_time'], name='reservation_room_time_idx'),
+            # Overlap checks: end_time > start only scans reservations that have not ended yet
+            models.Index(fields=['floor', 'end_time'], name='reservation_floor_end_idx'),
+            # Incremental rollup refresh reads only the reservations created since its watermark
+            models.Index(fields=['created_at'], name='reservation_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored room, start and duration so the weekly usage counters can
+        # move the right amount when this instance is saved or deleted
+        if {'room_id', 'reservation_time', 'duration'} <= set(field_names):
+            instance._stored_usage = (instance.room_id, instance.reservation_time, instance.duration)
+        # Likewise for the floor usage rollup, which is keyed on the floor rather than the room
+        if {'floor_id', 'reservation_time', 'duration'} <= set(field_names):
+            instance._stored_rollup = (instance.floor_id, instance.reservation_time, instance.duration)
+        return instance
 
     def save(self, *args, **kwargs):
+        # The weekly usage counters are updated by post_save, inside the same transaction
+        with transaction.atomic():
+            self._save(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
         # Auto-populate the floor field from the room
         if self.room and not self.floor:
             self.floor = self.room.floor
+
+        # Keep the stored end time in sync with the start time and duration
+        self.end_time = self.reservation_time + self.duration
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'reservation_time', 'duration'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'end_time'}
+
         super(Reservation, self).save(*args, **kwargs)
 
     '''def delete(self, user=None, *args, **kwargs):
@@ -139,32 +177,33 @@ class Reservation(models.Model):
 
     def clean_overlap(self):
         """Check for overlapping reservations across all rooms on the same floor."""
+        from .intervals import FloorIntervals
+
+        if self.room_id is None or self.reservation_time is None or self.duration is None:
+            return  # The missing field is reported by its own validation
+
         reservation_end_time = self.reservation_time + self.duration
 
         # Get all reservations on the same floor as the current room
-        overlapping_reservations = Reservation.objects.filter(
-            room__floor=self.room.floor,  # Filter by the same floor as the room
-            reservation_time__lt=reservation_end_time,
-            reservation_time__gt=self.reservation_time - self.duration
-        ).exclude(pk=self.pk)
+        floor_intervals = FloorIntervals.load(self.room.floor_id, self.reservation_time, reservation_end_time, exclude_pk=self.pk)
 
-        if overlapping_reservations.exists():
+        if floor_intervals.overlaps(self.reservation_time, reservation_end_time):
             raise ValidationError(
                 f"Another room on floor {self.room.floor.floor_number} already has a reservation during this time.")
 
     def clean_weekly_limit(self):
         """Ensure the room doesn't exceed 4 hours of reservations per week."""
-        week_start = self.reservation_time - timedelta(days=self.reservation_time.weekday())  # Start of the week
-        week_end = week_start + timedelta(days=7)
-        weekly_reservations = Reservation.objects.filter(
-            room=self.room,
-            reservation_time__gte=week_start,
-            reservation_time__lt=week_end
-        ).exclude(pk=self.pk)
-        total_reserved_time = sum([res.duration for res in weekly_reservations], timedelta())
-        total_reserved_time += self.duration  # Add the current reservation to the total
-
-        if total_reserved_time > timedelta(hours=4):
+        from .validation import WEEKLY_LIMIT, week_bounds
+
+        week_start = week_bounds(self.reservation_time)[0].date()
+        reserved = RoomWeeklyUsage.objects.filter(room=self.room, week_start=week_start).values_list(
+            'reserved_minutes', flat=True
+        ).first() or 0
+        stored = getattr(self, '_stored_usage', None)
+        if stored is not None and stored[0] == self.room_id and week_bounds(stored[1])[0].date() == week_start:
+            reserved -= usage_minutes(stored[2])  # Don't count this reservation's own stored time twice
+
+        if timedelta(minutes=reserved) + self.duration > WEEKLY_LIMIT:
             raise ValidationError(
                 f"Room {self.room.room_number} cannot have more than 4 hours of reservations per week.")
 
@@ -209,4 +248,106 @@ class Reservation(models.Model):
     def __str__(self):
         return f"Reservation by {self.individual} for Room {self.room} on {self.reservation_time}"
 
+
+class ReservationArchive(models.Model):
+    """A past reservation moved out of Reservation by archive_reservations; same columns, read only."""
+    id = models.UUIDField(primary_key=True, editable=False)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    individual = models.ForeignKey(Individual, on_delete=models.CASCADE)
+    reservation_time = models.DateTimeField()
+    duration = models.DurationField()
+    created_at = models.DateTimeField()
+    floor = models.ForeignKey(Floor, on_delete=models.SET_NULL, null=True, blank=True)
+    end_time = models.DateTimeField()
+    archived_at = models.DateTimeField(db_default=Now())  # Filled in by the INSERT ... SELECT
+
+    class Meta:
+        indexes = [
+            # Exports and reports read history by floor or room and time
+            models.Index(fields=['floor', 'reservation_time'], name='archive_floor_time_idx'),
+            models.Index(fields=['room', 'reservation_time'], name='archive_room_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived reservation by {self.individual} for Room {self.room} on {self.reservation_time}"
+
+
+def usage_minutes(duration):
+    """Minutes a reservation counts against the weekly quota, rounded up."""
+    return -int(-duration.total_seconds() // 60)
+
+
+class RoomWeeklyUsage(models.Model):
+    """Reserved minutes of a room in one booking week, kept in step with its reservations."""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    week_start = models.DateField()  # Monday of the week, Bucharest time
+    reserved_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('room', 'week_start')
+
+    def __str__(self):
+        return f"{self.room} week of {self.week_start}: {self.reserved_minutes} min"
+
+
+class SlotPreference(models.Model):
+    """A room's ranked wish for a slot in a week that opens through the request window."""
+    PENDING = 'pending'
+    ALLOCATED = 'allocated'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (ALLOCATED, 'Allocated'), (REJECTED, 'Rejected')]
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    individual = models.ForeignKey(Individual, on_delete=models.CASCADE)  # Becomes the reservation's owner
+    week_start = models.DateField()  # Monday of the requested week, Bucharest time
+    rank = models.PositiveSmallIntegerField()  # 1 is the room's first choice
+    reservation_time = models.DateTimeField()
+    duration = models.DurationField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    reservation = models.ForeignKey(Reservation, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('room', 'week_start', 'rank')
+
+    def __str__(self):
+        return f"{self.room} choice {self.rank} for week of {self.week_start}"
+
+
+class AllocationRun(models.Model):
+    """Marks a week's request window as allocated; direct booking into that week opens afterwards."""
+    week_start = models.DateField(unique=True)
+    allocated = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Allocation for week of {self.week_start}"
+
+class FloorHourlyUsage(models.Model):
+    """Reserved time of a floor in one hour of one week, rolled up from the reservations."""
+    floor = models.ForeignKey(Floor, on_delete=models.CASCADE)
+    week_start = models.DateField()  # Monday of the week, Bucharest time
+    hour = models.PositiveSmallIntegerField()  # Hour of the week, 0 is Monday 00:00-01:00
+    reserved_seconds = models.IntegerField(default=0)
+    reservations = models.IntegerField(default=0)  # Reservations starting in this hour
+
+    class Meta:
+        unique_together = ('floor', 'week_start', 'hour')
+
+    def __str__(self):
+        return f"{self.floor} week of {self.week_start}, hour {self.hour}: {self.reserved_seconds} s"
+
+
+class RollupWatermark(models.Model):
+    """How far a rollup has been refreshed: reservations created up to rolled_up_to are included."""
+    FLOOR_USAGE = 'floor_hourly_usage'
+
+    name = models.CharField(max_length=50, unique=True)
+    rolled_up_to = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} up to {self.rolled_up_to}"
+
 # Create your models here.
@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ReservationCursorPagination(CursorPagination):
+    """Keyset pagination over (reservation_time, id), stable while new bookings arrive."""
+    ordering = ('reservation_time', 'id')
+    page_size = 200
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
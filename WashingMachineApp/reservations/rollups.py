@@ -0,0 +1,192 @@
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .analytics import COLUMN_FIELDS, COLUMNS, DAY, columns_of, hour_of_week, hour_pieces
+from .archive import reservation_history
+from .models import FloorHourlyUsage, Reservation, RollupWatermark
+from .validation import week_bounds
+
+# Only reservations created at least this long ago are rolled up, so a booking still
+# committing when the refresh runs can't end up behind the watermark and be skipped
+ROLLUP_SETTLE = timedelta(minutes=5)
+EPOCH_DATE = date(1970, 1, 1)
+
+
+def rollup_deltas(columns, sign=1):
+    """Return {(floor id, week start, hour of week): [seconds, starts]} for the reservations in columns."""
+    rows, hours, seconds, starts = hour_pieces(columns)
+    if not len(rows):
+        return {}
+
+    floors = columns['floor'][rows]
+    weeks = (hours // DAY + 3) // 7  # Monday-based week number, as in hour_of_week()
+    keys = np.stack([floors, weeks, hour_of_week(hours)], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    totals = np.bincount(inverse, weights=seconds)
+    counts = np.bincount(inverse, weights=starts)
+    return {
+        (floor, EPOCH_DATE + timedelta(weeks=week, days=-3), hour): [sign * round(total), sign * round(count)]
+        for (floor, week, hour), total, count in zip(unique.tolist(), totals.tolist(), counts.tolist())
+    }
+
+
+def apply_rollup(deltas):
+    """
+    Add rollup deltas to FloorHourlyUsage with F() increments, like usage.apply_usage().
+
+    Increments commute, so reservation writes and a running refresh can update the
+    same rows without holding the watermark lock.
+    """
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    if not deltas:
+        return
+
+    existing = set(FloorHourlyUsage.objects.filter(
+        floor_id__in={floor_id for floor_id, _, _ in deltas},
+        week_start__in={week_start for _, week_start, _ in deltas},
+        hour__in={hour for _, _, hour in deltas}
+    ).values_list('floor_id', 'week_start', 'hour').iterator(chunk_size=2000))
+    missing = [
+        FloorHourlyUsage(floor_id=floor_id, week_start=week_start, hour=hour, reserved_seconds=seconds, reservations=count)
+        for (floor_id, week_start, hour), (seconds, count) in deltas.items()
+        if (floor_id, week_start, hour) not in existing and seconds >= 0 and count >= 0
+    ]
+    try:
+        with transaction.atomic():
+            FloorHourlyUsage.objects.bulk_create(missing, batch_size=1000)
+    except IntegrityError:
+        pass  # Another transaction created some of them; fall back to one row at a time
+    else:
+        deltas = {key: values for key, values in deltas.items() if key in existing}
+
+    for (floor_id, week_start, hour), (seconds, count) in deltas.items():
+        row = FloorHourlyUsage.objects.filter(floor_id=floor_id, week_start=week_start, hour=hour)
+        increments = {'reserved_seconds': F('reserved_seconds') + seconds, 'reservations': F('reservations') + count}
+        if row.update(**increments):
+            continue
+
+        if seconds < 0 or count < 0:
+            # No row to take time off (e.g. it was deleted along with its floor)
+            continue
+        try:
+            with transaction.atomic():
+                FloorHourlyUsage.objects.create(
+                    floor_id=floor_id, week_start=week_start, hour=hour, reserved_seconds=seconds, reservations=count
+                )
+        except IntegrityError:
+            # Another transaction created the row first
+            row.update(**increments)
+
+
+def lock_watermark():
+    """Lock and return the floor usage watermark so refreshes run one at a time; call inside a transaction."""
+    watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=RollupWatermark.FLOOR_USAGE)
+    return watermark
+
+
+def refresh_floor_usage(now=None, rebuild=False):
+    """
+    Roll the reservations created since the watermark into FloorHourlyUsage.
+
+    Reads only that delta through the created_at index, so the cost follows the number
+    of new reservations rather than the size of the history. Returns (watermark, rows
+    rolled up).
+    """
+    cutoff = (now or timezone.now()) - ROLLUP_SETTLE
+    with transaction.atomic():
+        watermark = lock_watermark()
+        if rebuild:
+            FloorHourlyUsage.objects.all().delete()
+            watermark.rolled_up_to = None
+
+        if watermark.rolled_up_to is None:
+            # Archived reservations were all rolled up before, so they count again on a rebuild
+            delta = reservation_history(COLUMN_FIELDS, created_at__lte=cutoff, floor__isnull=False)
+        elif watermark.rolled_up_to >= cutoff:
+            return watermark, 0
+        else:
+            delta = Reservation.objects.filter(
+                created_at__gt=watermark.rolled_up_to, created_at__lte=cutoff, floor__isnull=False
+            ).values_list(*COLUMN_FIELDS)
+
+        columns = columns_of(delta)
+        apply_rollup(rollup_deltas(columns))
+        watermark.rolled_up_to = cutoff
+        watermark.save()
+    return watermark, len(columns)
+
+
+def reservation_usage(floor_id, reservation_time, duration, sign=1):
+    """Rollup deltas of a single reservation."""
+    if floor_id is None:
+        return {}
+    columns = np.array([(floor_id, 0, int(reservation_time.timestamp()), int(duration.total_seconds()))], dtype=COLUMNS)
+    return rollup_deltas(columns, sign)
+
+
+def merge_deltas(*deltas):
+    merged = {}
+    for delta in deltas:
+        for key, (seconds, count) in delta.items():
+            total = merged.setdefault(key, [0, 0])
+            total[0] += seconds
+            total[1] += count
+    return merged
+
+
+def rolled_up(reservation):
+    """
+    Return the watermark if the reservation is already counted in the rollup, else None.
+
+    The watermark is read without a lock, so reservation writes neither queue behind
+    each other nor behind a refresh. A change that commits while a refresh covering
+    the reservation is still running can be missed; refresh_usage_rollups --rebuild
+    recounts.
+    """
+    rolled_up_to = RollupWatermark.objects.filter(name=RollupWatermark.FLOOR_USAGE).values_list(
+        'rolled_up_to', flat=True
+    ).first()
+    if rolled_up_to is None or reservation.created_at is None or reservation.created_at > rolled_up_to:
+        return None
+    return rolled_up_to
+
+
+def rebuild_floor_week(floor_id, reservation_time, rolled_up_to):
+    """Recount one floor and week of the rollup from the reservations already rolled up."""
+    week_start, week_end = week_bounds(reservation_time)
+    FloorHourlyUsage.objects.filter(floor_id=floor_id, week_start=week_start.date()).delete()
+    apply_rollup(rollup_deltas(columns_of(reservation_history(
+        COLUMN_FIELDS, floor_id=floor_id, reservation_time__gte=week_start, reservation_time__lt=week_end,
+        created_at__lte=rolled_up_to
+    ))))
+
+
+def reservation_saved(reservation, created):
+    """Move an updated, already rolled up reservation's time from its stored hours to its new ones."""
+    current = (reservation.floor_id, reservation.reservation_time, reservation.duration)
+    stored = getattr(reservation, '_stored_rollup', None)
+    # New reservations are picked up by the next refresh
+    rolled_up_to = not created and stored != current and rolled_up(reservation)
+    if rolled_up_to:
+        if stored is None:
+            # Saved without its stored values being loaded; the old hours can't be credited,
+            # so recount the new week and leave the rest to refresh_usage_rollups --rebuild
+            if reservation.floor_id is not None:
+                rebuild_floor_week(reservation.floor_id, reservation.reservation_time, rolled_up_to)
+        else:
+            apply_rollup(merge_deltas(reservation_usage(*stored, sign=-1), reservation_usage(*current)))
+    reservation._stored_rollup = current
+
+
+def reservation_removed(reservation):
+    """Take a deleted reservation's time out of the rollup if it had been rolled up."""
+    stored = getattr(
+        reservation, '_stored_rollup', (reservation.floor_id, reservation.reservation_time, reservation.duration)
+    )
+    if stored[0] is not None and rolled_up(reservation):
+        apply_rollup(reservation_usage(*stored, sign=-1))
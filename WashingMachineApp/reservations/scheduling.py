@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import Reservation, RoomWeeklyUsage
+from .validation import (
+    BUCHAREST_TZ, END_OF_DAY, START_OF_DAY, WEEKLY_LIMIT, booking_window, schedule_error, week_bounds
+)
+
+SUGGESTION_STEP = timedelta(minutes=10)  # Suggested start times fall on this grid
+MAX_SUGGESTIONS = 20
+
+
+def opening_hours(range_start, range_end):
+    """Yield the [7:00, 23:00) opening hours of every day but Sunday, clipped to the range."""
+    day = range_start.astimezone(BUCHAREST_TZ).date()
+    last_day = range_end.astimezone(BUCHAREST_TZ).date()
+    while day <= last_day:
+        if day.weekday() != 6:
+            opening = max(BUCHAREST_TZ.localize(datetime.combine(day, START_OF_DAY)), range_start)
+            closing = min(BUCHAREST_TZ.localize(datetime.combine(day, END_OF_DAY)), range_end)
+            if opening < closing:
+                yield opening, closing
+        day += timedelta(days=1)
+
+
+def free_periods(busy, openings):
+    """
+    Yield the free [start, end) periods left in the openings by the busy intervals.
+
+    Both inputs are sorted by start, so a single merge-style pass over them suffices.
+    """
+    busy = iter(busy)
+    current = next(busy, None)
+    for opening, closing in openings:
+        cursor = opening
+        # Skip reservations that ended before this opening
+        while current is not None and current[1] <= cursor:
+            current = next(busy, None)
+        while current is not None and current[0] < closing:
+            if current[0] > cursor:
+                yield cursor, current[0]
+            cursor = max(cursor, current[1])
+            if current[1] > closing:
+                break  # Still running at closing time; it may cover the next opening too
+            current = next(busy, None)
+        if cursor < closing:
+            yield cursor, closing
+
+
+def nearest_starts(first, last, desired, anchor, k):
+    """Return up to k grid start times in [first, last], nearest to desired first."""
+    low = -((anchor - first) // SUGGESTION_STEP)  # First grid index at or after first
+    high = (last - anchor) // SUGGESTION_STEP
+    if low > high:
+        return []
+
+    nearest = min(max(round((desired - anchor) / SUGGESTION_STEP), low), high)
+    starts = [anchor + nearest * SUGGESTION_STEP]
+    below, above = nearest - 1, nearest + 1
+    while len(starts) < k and (below >= low or above <= high):
+        below_start = anchor + below * SUGGESTION_STEP
+        above_start = anchor + above * SUGGESTION_STEP
+        if above > high or (below >= low and desired - below_start <= above_start - desired):
+            starts.append(below_start)
+            below -= 1
+        else:
+            starts.append(above_start)
+            above += 1
+    return starts
+
+
+def suggest_slots(floor_id, room_id, desired, duration, flexibility, k=5, now=None):
+    """
+    Return up to k feasible (reservation_time, duration) slots nearest to desired.
+
+    Only starts within flexibility of desired are considered. A slot is feasible when it
+    passes every booking rule: no overlap on the floor, the room's weekly quota, opening
+    hours, no Sundays, and the current/next week window. The floor's reservations in the
+    search range are read once, in start order, and swept together with the opening hours.
+    """
+    now = now or timezone.now()
+    window_start, window_end = booking_window(now)
+
+    earliest = max(desired - flexibility, now, window_start)
+    latest = min(desired + flexibility, window_end - timedelta(microseconds=1))
+    if earliest > latest:
+        return []
+    range_end = latest + duration
+
+    busy = Reservation.objects.filter(
+        floor_id=floor_id,
+        reservation_time__lt=range_end,
+        end_time__gt=earliest
+    ).order_by('reservation_time').values_list('reservation_time', 'end_time')
+    reserved = dict(RoomWeeklyUsage.objects.filter(
+        room_id=room_id,
+        week_start__range=(week_bounds(earliest)[0].date(), week_bounds(latest)[0].date())
+    ).values_list('week_start', 'reserved_minutes'))
+
+    candidates = []
+    for start, end in free_periods(busy, opening_hours(earliest, range_end)):
+        week_start = week_bounds(start)[0].date()
+        if timedelta(minutes=reserved.get(week_start, 0)) + duration > WEEKLY_LIMIT:
+            continue  # The room has no quota left that week
+        for slot in nearest_starts(start, min(end - duration, latest), desired, window_start, k):
+            if schedule_error(slot, duration, now) is None:
+                candidates.append((abs(slot - desired), slot))
+
+    candidates.sort()
+    return [(slot, duration) for _, slot in candidates[:k]]
@@ -1,12 +1,21 @@
-import pytz
 from rest_framework import serializers
-from django.utils import timezone
-from datetime import timedelta, time
-from .models import Floor, Room, Individual, WashingMachineRoom, Reservation
+from datetime import timedelta
+from .models import Floor, Room, Individual, WashingMachineRoom, Reservation, SlotPreference
+from .validation import (
+    BUCHAREST_TZ, MAX_DURATION, MIN_DURATION, OVERLAP_ERROR, WEEKLY_LIMIT, WEEKLY_LIMIT_ERROR, check_conflicts,
+    schedule_error, week_bounds
+)
+from .scheduling import MAX_SUGGESTIONS
+from .allocation import MAX_PREFERENCES, PENDING_ALLOCATION_ERROR, allocation_pending, request_week
 from rest_framework.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q
 from django.db.utils import IntegrityError
-from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import FloorRefreshToken, add_user_claims
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework import serializers
 from .models import Individual, Room
 
@@ -36,6 +45,28 @@ Individual = get_user_model()
 
 
 
+class FloorTokenObtainPairSerializer(TokenObtainPairSerializer):
+    # Embed room, floor and staff claims so read requests don't need to load the user
+    token_class = FloorRefreshToken
+
+
+class FloorTokenRefreshSerializer(TokenRefreshSerializer):
+    """Mint access tokens with the user's current room, floor and staff flag, not the refresh token's copy."""
+    token_class = FloorRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = Individual.objects.select_related('room').filter(
+            **{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]}
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed("No active account found for the given token.", code='no_active_account')
+
+        data = super().validate(attrs)
+        data['access'] = str(add_user_claims(refresh.access_token, user))
+        return data
+
+
 class IndividualRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     confirm_password = serializers.CharField(write_only=True)
@@ -73,44 +104,40 @@ class IndividualRegisterSerializer(serializers.ModelSerializer):
         if data['password'] != data['confirm_password']:
             raise serializers.ValidationError({"detail": "Passwords do not match."})
 
-        # Check if the email already exists (highest priority)
-        if Individual.objects.filter(email=data['email']).exists():
-            raise serializers.ValidationError({"detail": "The email is already registered."})
+        # Check email, username and national ID uniqueness in a single query
+        collisions = list(Individual.objects.filter(
+            Q(email=data['email']) | Q(username=data['username']) | Q(national_id=data['national_id'])
+        ).values_list('email', 'username', 'national_id'))
 
-        # Check if the username already exists
-        if Individual.objects.filter(username=data['username']).exists():
+        # Report the collision with the highest priority: email, then username, then national ID
+        if any(email == data['email'] for email, _, _ in collisions):
+            raise serializers.ValidationError({"detail": "The email is already registered."})
+        if any(username == data['username'] for _, username, _ in collisions):
             raise serializers.ValidationError({"detail": "The username already exists."})
-
-        # Check if the national ID already exists
-        if Individual.objects.filter(national_id=data['national_id']).exists():
+        if collisions:
             raise serializers.ValidationError({"detail": "The national ID is already registered."})
 
-        # Validate that the room number exists
+        # Validate that the room number exists, counting its occupants in the same query
         room_number = data.get('room_number')
-        room = Room.objects.filter(room_number=room_number).first()
+        room = Room.objects.filter(room_number=room_number).annotate(occupants=Count('individual')).first()
 
         if not room:
             raise serializers.ValidationError({"detail": "The room number does not exist. Please contact administration."})
 
         # Check if the room is full
-        if room.individual_set.count() >= room.max_occupants:
+        if room.occupants >= room.max_occupants:
             raise serializers.ValidationError({"detail": "The room is full. Please contact administration."})
 
+        # Carry the resolved room over to create()
+        data['room'] = room
+
         return data
 
     def create(self, validated_data):
         # Remove 'confirm_password' and 'room_number' since they're not model fields
         validated_data.pop('confirm_password', None)
-        room_number = validated_data.pop('room_number', None)
-
-        # Get the Room instance
-        try:
-            room = Room.objects.get(room_number=room_number)
-        except Room.DoesNotExist:
-            raise serializers.ValidationError({'room_number': 'Room does not exist. Please contact administration.'})
-
-        # Assign the room to the user
-        validated_data['room'] = room
+        validated_data.pop('room_number', None)
+        room = validated_data['room']
 
         # Extract and remove the password from validated_data
         password = validated_data.pop('password')
@@ -122,7 +149,15 @@ class IndividualRegisterSerializer(serializers.ModelSerializer):
         # Set is_active to False
         user.is_active = False
 
-        user.save()  # Save the user to the database
+        with transaction.atomic():
+            # Lock the room so concurrent signups for it are admitted one at a time
+            room = Room.objects.select_for_update().get(pk=room.pk)
+
+            user.save()  # Save the user to the database
+
+            # Recount with the new user included and roll back if the room is now oversubscribed
+            if room.individual_set.count() > room.max_occupants:
+                raise serializers.ValidationError({"detail": "The room is full. Please contact administration."})
 
         return user
 
@@ -164,78 +199,103 @@ class ReservationSerializer(serializers.ModelSerializer):
         if self.instance and self.instance.individual != user:
             raise PermissionDenied("You do not have permission to update this reservation.")
 
-        # Validation 1: Ensure the duration is between 40 minutes and 4 hours
-        if duration < timedelta(minutes=40):
-            raise serializers.ValidationError("Reservations must be at least 40 minutes long.")
-        if duration > timedelta(hours=4):
-            raise serializers.ValidationError("Reservations cannot exceed 4 hours (240 minutes).")
+        # Validations 1 and 4-7 need no database access, so they run before any query
+        error = schedule_error(reservation_time, duration)
+        if error:
+            raise serializers.ValidationError(error)
+
+        # In request window mode next week is handed out by the allocator first
+        if allocation_pending(reservation_time):
+            raise serializers.ValidationError(PENDING_ALLOCATION_ERROR)
+
+        # Validations 2 and 3: floor overlap through FloorIntervals and the room's weekly usage counter
+        conflicts = check_conflicts(room, reservation_time, duration, exclude=self.instance)
 
         # Validation 2: Check for overlapping reservations on the same floor
-        reservation_end_time = reservation_time + duration
-        overlapping_reservations = Reservation.objects.filter(
-            room__floor=room.floor,
-            reservation_time__lt=reservation_end_time,
-            reservation_time__gt=reservation_time - duration
-        )
-
-        # Exclude the instance if it's an update operation
-        if self.instance:
-            overlapping_reservations = overlapping_reservations.exclude(pk=self.instance.pk)
-
-        if overlapping_reservations.exists():
-            raise serializers.ValidationError(
-                f"Another room on floor {room.floor.floor_number} already has a reservation during this time."
-            )
+        if conflicts.has_overlap:
+            raise serializers.ValidationError(OVERLAP_ERROR.format(floor_number=room.floor.floor_number))
 
         # Validation 3: Ensure the room doesn't exceed 4 hours of reservations per week
-        week_start = reservation_time - timedelta(days=reservation_time.weekday())
-        week_end = week_start + timedelta(days=7)
-        weekly_reservations = Reservation.objects.filter(
-            room=room,
-            reservation_time__gte=week_start,
-            reservation_time__lt=week_end
-        )
-
-        # Exclude the instance if it's an update operation
-        if self.instance:
-            weekly_reservations = weekly_reservations.exclude(pk=self.instance.pk)
-
-        total_reserved_time = sum([res.duration for res in weekly_reservations], timedelta())
-        total_reserved_time += duration
-
-        if total_reserved_time > timedelta(hours=4):
-            raise serializers.ValidationError(
-                f"Room {room.room_number} cannot have more than 4 hours of reservations per week.")
-
-        # Validation 4: No reservations in the past
-        if reservation_time < timezone.now():
-            raise serializers.ValidationError("Reservations cannot be made in the past.")
-
-        # Validation 5: No reservations on Sundays
-        if reservation_time.weekday() == 6:
-            raise serializers.ValidationError("Reservations cannot be made on Sundays.")
-
-        # Validation 6: Ensure reservation is within working hours (7:00 AM to 11:00 PM)
-        reservation_start_time = reservation_time.time()
-        reservation_end_time_time = (reservation_time + duration).time()
-
-        start_of_day = time(7, 0)  # 7:00 AM
-        end_of_day = time(23, 0)  # 11:00 PM
-
-        if not (start_of_day <= reservation_start_time <= end_of_day):
-            raise serializers.ValidationError("Reservations can only start between 7:00 AM and 11:00 PM.")
-        if not (start_of_day <= reservation_end_time_time <= end_of_day):
-            raise serializers.ValidationError("Reservations must end by 11:00 PM.")
-
-        # Validation 7: Ensure reservation is within this week or next week
-        bucharest_tz = pytz.timezone('Europe/Bucharest')
-        now_in_bucharest = timezone.now().astimezone(bucharest_tz)
-        start_of_this_week = now_in_bucharest - timedelta(days=now_in_bucharest.weekday())
-        start_of_this_week = start_of_this_week.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_next_week = start_of_this_week + timedelta(days=13)
-        end_of_next_week = end_of_next_week.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-        if not (start_of_this_week <= reservation_time.astimezone(bucharest_tz) <= end_of_next_week):
-            raise serializers.ValidationError("Reservations can only be made within the current and next week.")
-
-        return data
\ No newline at end of file
+        if conflicts.weekly_total + duration > WEEKLY_LIMIT:
+            raise serializers.ValidationError(WEEKLY_LIMIT_ERROR.format(room_number=room.room_number))
+
+        return data
+
+MAX_BULK_RESERVATIONS = 28
+
+
+class BulkReservationItemSerializer(serializers.Serializer):
+    reservation_time = serializers.DateTimeField()
+    duration = serializers.DurationField()
+
+
+class RecurrenceSerializer(serializers.Serializer):
+    start = serializers.DateTimeField()
+    duration = serializers.DurationField()
+    every_days = serializers.IntegerField(min_value=1, default=7)
+    count = serializers.IntegerField(min_value=1, max_value=MAX_BULK_RESERVATIONS)
+
+
+class SlotSuggestionSerializer(serializers.Serializer):
+    reservation_time = serializers.DateTimeField()
+    duration = serializers.DurationField(min_value=MIN_DURATION, max_value=MAX_DURATION)
+    flexibility = serializers.DurationField(
+        default=timedelta(days=1), min_value=timedelta(0), max_value=timedelta(days=14)
+    )
+    k = serializers.IntegerField(default=5, min_value=1, max_value=MAX_SUGGESTIONS)
+
+
+class SlotPreferenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SlotPreference
+        fields = ['rank', 'reservation_time', 'duration', 'status', 'reservation']
+        read_only_fields = fields
+
+
+class SlotPreferenceRequestSerializer(serializers.Serializer):
+    """A room's ranked preferences for the request week, best first."""
+    preferences = BulkReservationItemSerializer(many=True)
+
+    def validate_preferences(self, value):
+        if not value:
+            raise serializers.ValidationError("At least one preference is required.")
+        if len(value) > MAX_PREFERENCES:
+            raise serializers.ValidationError(f"No more than {MAX_PREFERENCES} preferences can be given.")
+
+        week_start = request_week()
+        for rank, item in enumerate(value, start=1):
+            error = schedule_error(item['reservation_time'], item['duration'])
+            if error is None and week_bounds(item['reservation_time'])[0].date() != week_start:
+                error = "Preferences can only be given for next week."
+            if error:
+                raise serializers.ValidationError(f"Preference {rank}: {error}")
+        return value
+
+
+class BulkReservationSerializer(serializers.Serializer):
+    """Accept either an explicit list of reservations or a recurrence rule, expanded into 'items'."""
+    reservations = BulkReservationItemSerializer(many=True, required=False)
+    recurrence = RecurrenceSerializer(required=False)
+
+    def validate(self, data):
+        if ('reservations' in data) == ('recurrence' in data):
+            raise serializers.ValidationError("Provide either 'reservations' or 'recurrence'.")
+
+        if 'reservations' in data:
+            items = [(item['reservation_time'], item['duration']) for item in data['reservations']]
+        else:
+            rule = data['recurrence']
+            # Repeat on the same wall-clock time in Bucharest, even across DST changes
+            local_start = rule['start'].astimezone(BUCHAREST_TZ).replace(tzinfo=None)
+            items = [
+                (BUCHAREST_TZ.localize(local_start + timedelta(days=rule['every_days'] * occurrence)), rule['duration'])
+                for occurrence in range(rule['count'])
+            ]
+
+        if not items:
+            raise serializers.ValidationError("At least one reservation is required.")
+        if len(items) > MAX_BULK_RESERVATIONS:
+            raise serializers.ValidationError(f"No more than {MAX_BULK_RESERVATIONS} reservations can be made at once.")
+
+        data['items'] = items
+        return data
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import rollups, usage
+from .authentication import revoke_claims
+from .availability import availability_index
+from .caching import ALL_RESERVATIONS, REFERENCE_DATA, bump_version, get_version, reservation_namespace
+from .events import broker, reservation_event
+from .models import Floor, Individual, Reservation, Room, WashingMachineRoom
+
+
+def reservations_created(reservations, event_type='created'):
+    """Apply new or changed reservations to the in-memory indexes once they are committed.
+
+    bulk_create() sends no post_save signal, so bulk paths call this directly.
+    """
+    def apply():
+        for reservation in reservations:
+            availability_index.put(reservation.floor_id, reservation.pk, reservation.reservation_time, reservation.end_time)
+            broker.publish(reservation.floor_id, reservation_event(event_type, reservation))
+        # This process's index already holds the change, so it stays current across the bump
+        availability_index.advance(reservation_feeds_changed({reservation.floor_id for reservation in reservations}))
+
+    # Apply to the in-memory indexes only once the rows are visible to other requests
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, created, **kwargs):
+    # Runs inside Reservation.save()'s transaction, so the counter commits with the row
+    usage.reservations_saved([instance], created)
+    rollups.reservation_saved(instance, created)
+    reservations_created([instance], 'created' if created else 'updated')
+
+
+def reservation_feeds_changed(floor_ids):
+    """Bump the version counters behind the reservation list ETags; return {floor id: (old, new version)}."""
+    versions = {}
+    for floor_id in floor_ids:
+        namespace = reservation_namespace(floor_id)
+        versions[floor_id] = (get_version(namespace), bump_version(namespace))
+    bump_version(ALL_RESERVATIONS)
+    return versions
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance, **kwargs):
+    usage.reservation_removed(instance)
+    rollups.reservation_removed(instance)
+
+    # delete() clears instance.pk before the transaction commits, so capture it now
+    reservation_id = instance.pk
+    event = reservation_event('deleted', instance)
+
+    def apply():
+        availability_index.discard(reservation_id)
+        broker.publish(instance.floor_id, event)
+        availability_index.advance(reservation_feeds_changed({instance.floor_id}))
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Floor)
+@receiver(post_delete, sender=Floor)
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=WashingMachineRoom)
+@receiver(post_delete, sender=WashingMachineRoom)
+def reference_data_changed(sender, **kwargs):
+    # Rooms and washing machine rooms embed their floor, so any change invalidates all three
+    transaction.on_commit(lambda: bump_version(REFERENCE_DATA))
+
+
+@receiver(post_save, sender=Individual)
+@receiver(post_delete, sender=Individual)
+def individual_changed(sender, instance, **kwargs):
+    # The user's tokens may carry an outdated room, floor or staff flag
+    transaction.on_commit(lambda: revoke_claims([instance.pk]))
+
+
+@receiver(post_save, sender=Room)
+@receiver(pre_delete, sender=Room)
+def room_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    # Occupants' floor claims go stale if the room moves floors or is deleted
+    occupants = list(instance.individual_set.values_list('pk', flat=True))
+    transaction.on_commit(lambda: revoke_claims(occupants))
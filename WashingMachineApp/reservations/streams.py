@@ -0,0 +1,109 @@
+import heapq
+import json
+from datetime import datetime
+from itertools import count
+
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+
+from .authentication import user_floor_id
+from .async_views import NotAuthenticated, aauthenticate, error_response
+from .events import broker
+from .models import Floor, Reservation
+from .validation import booking_window
+
+KEEPALIVE_SECONDS = 15
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(subscription, upcoming):
+    """
+    Relay the floor's reservation events and emit 'started' when a known reservation begins.
+
+    upcoming is a list of (start, id, event) for reservations that have not started yet;
+    created and updated events extend it while the stream is open.
+    """
+    sequence = count()  # Tie-breaker so the heap never compares event dicts
+    queue = [(start, next(sequence), reservation_id, event) for start, reservation_id, event in upcoming]
+    heapq.heapify(queue)
+    starts = {reservation_id: start for start, _, reservation_id, _ in queue}
+    try:
+        yield ": connected\n\n"
+        while True:
+            now = timezone.now()
+            while queue and queue[0][0] <= now:
+                start, _, reservation_id, event = heapq.heappop(queue)
+                # Skip reservations that were moved or cancelled since they were queued
+                if starts.get(reservation_id) == start:
+                    del starts[reservation_id]
+                    yield format_event({**event, 'type': 'started'})
+
+            timeout = KEEPALIVE_SECONDS
+            if queue:
+                timeout = max(0, min(timeout, (queue[0][0] - now).total_seconds()))
+
+            event = await subscription.get(timeout)
+            if subscription.lagging:
+                # Events were dropped for this slow client; tell it to refetch the floor
+                subscription.lagging = False
+                yield format_event({'type': 'resync', 'floor': subscription.floor_id})
+
+            if event is None:
+                if not queue or queue[0][0] > timezone.now():
+                    yield ": keepalive\n\n"
+                continue
+
+            if event['type'] == 'deleted':
+                starts.pop(event['id'], None)
+            else:
+                start = datetime.fromisoformat(event['reservation_time'])
+                if start > timezone.now():
+                    starts[event['id']] = start
+                    heapq.heappush(queue, (start, next(sequence), event['id'], event))
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@require_safe
+async def floor_events(request, floor_id):
+    """Server-Sent Events feed of reservation changes on one floor (serve under ASGI)."""
+    try:
+        user = await aauthenticate(request)
+    except NotAuthenticated as exc:
+        return error_response(exc.detail, 401)
+
+    if not user.is_staff and user_floor_id(user) != floor_id:
+        return JsonResponse({'detail': "You can only follow your own floor."}, status=403)
+    if not await Floor.objects.filter(pk=floor_id).aexists():
+        return JsonResponse({'detail': "Not found."}, status=404)
+
+    # Subscribe before loading so nothing committed in between is missed
+    subscription = broker.subscribe(floor_id)
+    now = timezone.now()
+    upcoming = []
+    reservations = Reservation.objects.filter(
+        floor_id=floor_id,
+        reservation_time__gt=now,
+        reservation_time__lt=booking_window(now)[1]
+    ).values_list('pk', 'reservation_time', 'end_time')
+    try:
+        async for reservation_id, start, end in reservations:
+            upcoming.append((start, str(reservation_id), {
+                'id': str(reservation_id),
+                'floor': floor_id,
+                'reservation_time': start.isoformat(),
+                'end_time': end.isoformat(),
+            }))
+    except BaseException:
+        broker.unsubscribe(subscription)
+        raise
+
+    response = StreamingHttpResponse(event_stream(subscription, upcoming), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1157 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import Group, Permission
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .admin import FLOOR_ADMINS_GROUP, RoomForm
+from .allocation import PENDING_ALLOCATION_ERROR, allocate_floor, allocate_week, request_week
+from .analytics import utilisation_report
+from .authentication import CLAIMS_ISSUED_AT, FloorRefreshToken, claims_max_age
+from .availability import availability_index
+from .caching import bump_version, get_cache, reservation_namespace
+from .events import SUBSCRIBER_QUEUE_SIZE, broker
+from .exports import EXPORT_COLUMNS, EXPORT_FORMATS, export_queryset
+from .intervals import FloorIntervals
+from .models import (
+    AllocationRun, Floor, FloorHourlyUsage, Individual, Reservation, ReservationArchive, Room, RoomWeeklyUsage,
+    SlotPreference
+)
+from .rollups import refresh_floor_usage
+from .serializers import IndividualRegisterSerializer
+from .scheduling import SUGGESTION_STEP, free_periods, nearest_starts, suggest_slots
+from .streams import event_stream, format_event
+from .validation import (
+    BUCHAREST_TZ, OVERLAP_ERROR, WEEKLY_LIMIT, booking_window, check_conflicts, schedule_error, week_bounds,
+    week_bounds_of
+)
+
+
+def bookable_time(hour, minute=0):
+    """A time on the first bookable day after tomorrow; always inside the booking window."""
+    day = (timezone.now() + timedelta(days=2)).astimezone(BUCHAREST_TZ).date()
+    if day.weekday() == 6:
+        day += timedelta(days=1)
+    return BUCHAREST_TZ.localize(datetime.combine(day, datetime.min.time().replace(hour=hour, minute=minute)))
+
+
+class ReservationTestCase(TestCase):
+    """Starts from an empty cache with one floor, one room and one resident."""
+
+    def setUp(self):
+        get_cache().clear()
+        self.floor = Floor.objects.create(floor_number=1)
+        self.room = Room.objects.create(floor=self.floor, room_number=101)
+        self.user = Individual.objects.create_user('resident', password='secret', room=self.room)
+
+    def at(self, day, hour, minute=0):
+        """A Bucharest time on the given day of the week starting Monday 2030-01-07."""
+        return BUCHAREST_TZ.localize(datetime(2030, 1, 7 + day, hour, minute))
+
+    def reserve(self, start, minutes=60, room=None):
+        room = room or self.room
+        return Reservation.objects.create(
+            room=room, individual=self.user, reservation_time=start, duration=timedelta(minutes=minutes)
+        )
+
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {FloorRefreshToken.for_user(user).access_token}'}
+
+    def assertGetQueries(self, num, path, **headers):
+        """GET path, asserting it succeeds with exactly num queries, and return the response."""
+        with self.assertNumQueries(num):
+            response = self.client.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class BulkUserChangeRevocationTests(ReservationTestCase):
+    """Admin paths that change users with update() must still revoke their token claims."""
+
+    def setUp(self):
+        super().setUp()
+        self.admin = Individual.objects.create_superuser('admin', password='secret')
+        self.client.force_login(self.admin)
+
+    def test_deactivated_user_token_rejected(self):
+        headers = self.bearer(self.user)
+        self.assertEqual(self.client.get('/api/reservations/', **headers).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/admin/reservations/individual/', {
+                'action': 'deactivate_users', '_selected_action': [self.user.pk],
+            })
+
+        self.assertEqual(self.client.get('/api/reservations/', **headers).status_code, 401)
+
+    def test_room_form_revokes_added_occupants(self):
+        newcomer = Individual.objects.create_user('newcomer', password='secret')
+        headers = self.bearer(newcomer)
+
+        form = RoomForm(data={'individuals': [self.user.pk, newcomer.pk]}, instance=self.room)
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            form.save()
+
+        # The token still says "no room"; that claim must no longer be trusted
+        self.client.logout()
+        response = self.client.get('/api/reservations/', **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.wsgi_request.user, Individual)
+        self.assertEqual(response.wsgi_request.user.room_id, self.room.pk)
+
+
+class RegistrationCapacityTests(ReservationTestCase):
+    def signup(self, number):
+        return IndividualRegisterSerializer(data={
+            'username': f'student{number}', 'email': f'student{number}@student.upt.ro', 'national_id': f'ID{number}',
+            'password': 'secret', 'confirm_password': 'secret', 'room_number': self.room.room_number,
+        })
+
+    def test_last_place_goes_to_one_of_two_concurrent_signups(self):
+        # Both signups are validated while one place is still free, as when they arrive together
+        first, second = self.signup(1), self.signup(2)
+        self.assertTrue(first.is_valid(), first.errors)
+        self.assertTrue(second.is_valid(), second.errors)
+
+        first.save()
+        with self.assertRaisesMessage(ValidationError, "The room is full."):
+            second.save()
+        self.assertEqual(
+            sorted(self.room.individual_set.values_list('username', flat=True)), ['resident', 'student1']
+        )
+
+
+class ClaimsFreshnessTests(ReservationTestCase):
+    """Token claims are re-read on refresh and only trusted for a short time."""
+
+    def test_refresh_rereads_staff_flag(self):
+        self.user.is_staff = True
+        self.user.save()
+        refresh = FloorRefreshToken.for_user(self.user)
+        Individual.objects.filter(pk=self.user.pk).update(is_staff=False)
+        get_cache().clear()  # The revocation marker is gone, e.g. after a restart
+
+        response = self.client.post('/auth/refresh/', {'refresh': str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        access = AccessToken(response.data['access'])
+        self.assertFalse(access['is_staff'])
+
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {access}'}
+        self.assertEqual(self.client.get('/api/reservations/export/', **headers).status_code, 403)
+
+    def test_refresh_rejects_inactive_user(self):
+        refresh = FloorRefreshToken.for_user(self.user)
+        Individual.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertEqual(self.client.post('/auth/refresh/', {'refresh': str(refresh)}).status_code, 401)
+
+    def test_old_claims_load_the_user(self):
+        access = FloorRefreshToken.for_user(self.user).access_token
+        access[CLAIMS_ISSUED_AT] = time.time() - claims_max_age() - 1
+        Individual.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        response = self.client.get('/api/reservations/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 401)
+
+
+class CheckConflictsTests(ReservationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.neighbour = Room.objects.create(floor=self.floor, room_number=102)
+
+    def test_overlap_on_the_floor(self):
+        self.reserve(self.at(0, 10), room=self.neighbour)
+
+        self.assertTrue(check_conflicts(self.room, self.at(0, 10, 30), timedelta(minutes=40)).has_overlap)
+        # Half-open intervals: starting as the other one ends is fine
+        self.assertFalse(check_conflicts(self.room, self.at(0, 11), timedelta(minutes=40)).has_overlap)
+
+    def test_update_excludes_itself(self):
+        reservation = Reservation.objects.get(pk=self.reserve(self.at(0, 10), minutes=90).pk)
+
+        conflicts = check_conflicts(self.room, self.at(0, 10, 30), timedelta(minutes=60), exclude=reservation)
+        self.assertFalse(conflicts.has_overlap)
+        self.assertEqual(conflicts.weekly_total, timedelta())
+
+    def test_weekly_total_from_counter(self):
+        self.reserve(self.at(0, 10), minutes=90)
+        self.reserve(self.at(1, 10), minutes=60)
+        self.reserve(self.at(7, 10), minutes=60)  # Next week
+
+        self.assertEqual(check_conflicts(self.room, self.at(2, 10), timedelta(minutes=40)).weekly_total, timedelta(minutes=150))
+
+
+    def test_editing_duration_moves_the_end_time(self):
+        reservation = self.reserve(self.at(0, 10), minutes=60)
+        reservation.duration = timedelta(minutes=90)
+        reservation.save(update_fields=['duration'])
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.end_time, self.at(0, 11, 30))
+        self.assertTrue(check_conflicts(self.neighbour, self.at(0, 11), timedelta(minutes=40)).has_overlap)
+
+    def test_overlap_query_uses_the_floor_end_time_index(self):
+        for day in range(7):
+            self.reserve(self.at(day, 10), room=self.neighbour)
+        queryset = Reservation.objects.filter(
+            floor_id=self.floor.pk, reservation_time__lt=self.at(0, 12), end_time__gt=self.at(0, 10)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            FloorIntervals.load(self.floor.pk, self.at(0, 10), self.at(0, 12))
+        sql = queries[0]['sql']
+        self.assertIn('"reservations_reservation"."floor_id" = ', sql)
+        self.assertIn('"reservations_reservation"."end_time" > ', sql)
+        if connection.vendor == 'sqlite':
+            self.assertIn('reservation_floor_end_idx', queryset.explain())
+
+
+class FloorUsageRollupTests(ReservationTestCase):
+    def rolled_up_seconds(self, **filters):
+        return FloorHourlyUsage.objects.filter(floor=self.floor, **filters).aggregate(
+            total=Sum('reserved_seconds')
+        )['total'] or 0
+
+    def refresh(self):
+        # Pretend the settle delay has passed for everything booked so far
+        return refresh_floor_usage(now=timezone.now() + timedelta(hours=1))
+
+    def test_refresh_rolls_up_new_reservations(self):
+        self.reserve(self.at(0, 10, 30), minutes=60)
+        self.reserve(self.at(1, 10), minutes=40)
+
+        self.assertEqual(self.refresh()[1], 2)
+        self.assertEqual(self.rolled_up_seconds(), 100 * 60)
+        # Hours count from Monday 00:00; 10:30-11:30 is split across two of them
+        self.assertEqual(self.rolled_up_seconds(hour=10), 30 * 60)
+        self.assertEqual(self.rolled_up_seconds(hour=11), 30 * 60)
+        self.assertEqual(self.rolled_up_seconds(hour=24 + 10), 40 * 60)
+        self.assertEqual(self.refresh()[1], 0)
+
+    def test_changes_to_rolled_up_reservations_are_applied(self):
+        reservation = self.reserve(self.at(0, 10), minutes=60)
+        self.reserve(self.at(0, 14), minutes=60)
+        self.refresh()
+
+        reservation = Reservation.objects.get(pk=reservation.pk)
+        reservation.reservation_time = self.at(2, 18)
+        reservation.save()
+        self.assertEqual(self.rolled_up_seconds(hour=10), 0)
+        self.assertEqual(self.rolled_up_seconds(hour=2 * 24 + 18), 60 * 60)
+
+        reservation.delete()
+        self.assertEqual(self.rolled_up_seconds(), 60 * 60)
+
+    def test_rebuild_matches_incremental(self):
+        for day in range(3):
+            self.reserve(self.at(day, 9), minutes=40 + 10 * day)
+        self.refresh()
+        Reservation.objects.filter(reservation_time=self.at(1, 9)).get().delete()
+        incremental = sorted(FloorHourlyUsage.objects.filter(reserved_seconds__gt=0).values_list(
+            'week_start', 'hour', 'reserved_seconds', 'reservations'
+        ))
+
+        refresh_floor_usage(now=timezone.now() + timedelta(hours=1), rebuild=True)
+        self.assertEqual(sorted(FloorHourlyUsage.objects.values_list(
+            'week_start', 'hour', 'reserved_seconds', 'reservations'
+        )), incremental)
+
+
+class ReferenceDataCacheTests(ReservationTestCase):
+    def test_served_from_cache_until_a_room_changes(self):
+        headers = self.bearer(self.user)
+        self.client.get('/api/rooms/', **headers)
+        response = self.assertGetQueries(0, '/api/rooms/', **headers)
+        self.assertEqual([room['max_occupants'] for room in response.data], [2])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.max_occupants = 3
+            self.room.save()
+        response = self.client.get('/api/rooms/', **headers)
+        self.assertEqual([room['max_occupants'] for room in response.data], [3])
+
+
+class ImportInvalidatesReferenceDataTests(ReservationTestCase):
+    def test_imported_floors_are_listed(self):
+        headers = self.bearer(self.user)
+        response = self.client.get('/api/floors/', **headers)
+        etag = response['ETag']
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'dorm.csv'
+            path.write_text("floor_number,room_number\n2,201\n", encoding='utf-8')
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_dorm', str(path), stdout=StringIO())
+
+        response = self.client.get('/api/floors/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(floor['floor_number'] for floor in response.data), [1, 2])
+
+
+class AvailabilityIndexTests(ReservationTestCase):
+    def test_rebuilt_when_another_worker_changes_the_floor(self):
+        floor = availability_index.get(self.floor.pk)
+        self.assertIs(availability_index.get(self.floor.pk), floor)
+
+        # Written by another process: no signal reaches this index, only the shared version moves
+        start = floor.window_start + timedelta(days=1, hours=10)
+        Reservation.objects.bulk_create([Reservation(
+            room=self.room, floor=self.floor, individual=self.user,
+            reservation_time=start, duration=timedelta(minutes=40), end_time=start + timedelta(minutes=40)
+        )])
+        bump_version(reservation_namespace(self.floor.pk))
+
+        self.assertIsNone(availability_index.cached(self.floor.pk))
+        rebuilt = availability_index.get(self.floor.pk)
+        self.assertIsNot(rebuilt, floor)
+        self.assertEqual(len(rebuilt.reservations), 1)
+
+    def test_own_writes_keep_the_index_warm(self):
+        floor = availability_index.get(self.floor.pk)
+        start = bookable_time(10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = self.reserve(start, minutes=40)
+        self.assertIs(availability_index.cached(self.floor.pk), floor)
+        self.assertIn(reservation.pk, floor.reservations)
+        self.assertFalse(any(free_start <= start < free_end for free_start, free_end in floor.free_ranges()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertIs(availability_index.cached(self.floor.pk), floor)
+        self.assertNotIn(reservation.pk, floor.reservations)
+        self.assertTrue(any(free_start <= start < free_end for free_start, free_end in floor.free_ranges()))
+
+
+class FloorIntervalsOracleTests(SimpleTestCase):
+    """Compare FloorIntervals with a brute-force scan over random intervals."""
+
+    def test_matches_brute_force(self):
+        rng = random.Random(20240917)
+        origin = datetime(2030, 1, 7)
+        for _ in range(200):
+            intervals = []
+            for key in range(rng.randint(0, 40)):
+                start = origin + timedelta(minutes=rng.randint(0, 2000))
+                intervals.append((start, start + timedelta(minutes=rng.randint(1, 300)), key))
+            # Some intervals are loaded up front, the rest inserted one by one
+            split = rng.randint(0, len(intervals))
+            index = FloorIntervals(intervals[:split])
+            for start, end, key in intervals[split:]:
+                index.add(start, end, key)
+            self.assertEqual(len(index), len(intervals))
+
+            for _ in range(20):
+                start = origin + timedelta(minutes=rng.randint(-100, 2100))
+                end = start + timedelta(minutes=rng.randint(1, 300))
+                exclude = rng.choice([None, *range(len(intervals))])
+                expected = sorted(
+                    key for interval_start, interval_end, key in intervals
+                    if interval_start < end and interval_end > start and key != exclude
+                )
+                found = sorted(key for _, _, key in index.overlapping(start, end, exclude))
+                self.assertEqual(found, expected)
+                self.assertEqual(index.overlaps(start, end, exclude), bool(expected))
+
+
+class SchedulingOracleTests(SimpleTestCase):
+    """Compare the slot search building blocks with brute-force scans over minutes and grid points."""
+
+    def test_free_periods_match_brute_force(self):
+        rng = random.Random(20240918)
+        origin = datetime(2030, 1, 7)
+        for _ in range(200):
+            busy = []
+            for _ in range(rng.randint(0, 15)):
+                start = origin + timedelta(minutes=rng.randint(0, 3000))
+                busy.append((start, start + timedelta(minutes=rng.randint(1, 600))))
+            busy.sort()
+            openings, cursor = [], origin
+            for _ in range(rng.randint(1, 4)):
+                opening = cursor + timedelta(minutes=rng.randint(0, 600))
+                cursor = opening + timedelta(minutes=rng.randint(1, 600))
+                openings.append((opening, cursor))
+
+            expected = []
+            for opening, closing in openings:
+                minute = opening
+                while minute < closing:
+                    if not any(start <= minute < end for start, end in busy):
+                        if expected and expected[-1][1] == minute and expected[-1][0] >= opening:
+                            expected[-1] = (expected[-1][0], minute + timedelta(minutes=1))
+                        else:
+                            expected.append((minute, minute + timedelta(minutes=1)))
+                    minute += timedelta(minutes=1)
+            self.assertEqual(list(free_periods(busy, openings)), expected)
+
+    def test_nearest_starts_match_brute_force(self):
+        rng = random.Random(20240919)
+        anchor = datetime(2030, 1, 7)
+        for _ in range(500):
+            first = anchor + timedelta(minutes=rng.randint(0, 600))
+            last = first + timedelta(minutes=rng.randint(-20, 300))
+            desired = anchor + timedelta(minutes=rng.randint(-100, 1000))
+            k = rng.randint(1, 12)
+
+            grid = [
+                anchor + index * SUGGESTION_STEP for index in range(200)
+                if first <= anchor + index * SUGGESTION_STEP <= last
+            ]
+            expected = sorted(abs(start - desired) for start in grid)[:k]
+            starts = nearest_starts(first, last, desired, anchor, k)
+            self.assertEqual(len(set(starts)), len(starts))
+            self.assertLessEqual(set(starts), set(grid))
+            # Equidistant neighbours may come in either order, so compare distances
+            self.assertEqual([abs(start - desired) for start in starts], expected)
+
+
+class SuggestSlotsTests(ReservationTestCase):
+    def brute_force(self, desired, duration, flexibility, k, now):
+        """Every grid start in reach that passes the booking rules, nearest to desired first."""
+        window_start, window_end = booking_window(now)
+        intervals = FloorIntervals(Reservation.objects.values_list('reservation_time', 'end_time', 'pk'))
+        reserved = dict(RoomWeeklyUsage.objects.filter(room=self.room).values_list('week_start', 'reserved_minutes'))
+        slots = []
+        slot = window_start
+        while slot < window_end:
+            if (
+                abs(slot - desired) <= flexibility and slot >= now
+                and schedule_error(slot, duration, now) is None
+                and not intervals.overlaps(slot, slot + duration)
+                and timedelta(minutes=reserved.get(week_bounds(slot)[0].date(), 0)) + duration <= WEEKLY_LIMIT
+            ):
+                slots.append((abs(slot - desired), slot))
+            slot += SUGGESTION_STEP
+        return [(slot, duration) for _, slot in sorted(slots)[:k]]
+
+    def test_matches_brute_force(self):
+        rng = random.Random(20240920)
+        now = self.at(0, 8, 3)
+        neighbour = Room.objects.create(floor=self.floor, room_number=102)
+        for day in range(13):
+            cursor = self.at(day, 7)
+            while True:
+                cursor += timedelta(minutes=rng.randint(0, 360))
+                minutes = rng.randint(40, 120)
+                if cursor + timedelta(minutes=minutes) > self.at(day, 23):
+                    break
+                self.reserve(cursor, minutes, room=neighbour)
+                cursor += timedelta(minutes=minutes)
+        # The room has used up its quota in the second week
+        self.reserve(self.at(13, 8), minutes=240)
+
+        for _ in range(60):
+            desired = self.at(0, 0) + timedelta(minutes=rng.randint(0, 14 * 24 * 60))
+            duration = timedelta(minutes=rng.choice([40, 60, 90, 150, 240]))
+            flexibility = timedelta(minutes=rng.randint(0, 3 * 24 * 60))
+            k = rng.randint(1, 10)
+            self.assertEqual(
+                suggest_slots(self.floor.pk, self.room.pk, desired, duration, flexibility, k, now=now),
+                self.brute_force(desired, duration, flexibility, k, now)
+            )
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Residents of one floor racing for the same slot must end up with exactly one booking."""
+    threads = 200
+
+    def setUp(self):
+        get_cache().clear()
+        floor = Floor.objects.create(floor_number=1)
+        rooms = Room.objects.bulk_create([
+            Room(floor=floor, room_number=100 + number) for number in range(1, self.threads + 1)
+        ])
+        # Bearer tokens need no password, so skip create_user()'s hashing
+        self.users = Individual.objects.bulk_create([
+            Individual(username=f'resident{room.room_number}', password='!', room=room) for room in rooms
+        ])
+
+    def test_one_booking_wins_the_slot(self):
+        start = bookable_time(10)
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+
+        def book(user):
+            try:
+                barrier.wait()
+                response = self.client_class().post('/api/reservations/', {
+                    'reservation_time': start.isoformat(),
+                    'duration': '00:40:00',
+                }, **{'HTTP_AUTHORIZATION': f'Bearer {FloorRefreshToken.for_user(user).access_token}'})
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=book, args=(user,)) for user in self.users]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(statuses), self.threads)
+        self.assertEqual(statuses.count(201), 1)
+        self.assertEqual(statuses.count(400), self.threads - 1)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class ReservationListQueryTests(ReservationTestCase):
+    def test_thousand_reservations_in_one_query(self):
+        neighbour = Individual.objects.create_user('neighbour', first_name='Ana', last_name='Pop', room=self.room)
+        window_start = booking_window()[0]
+        Reservation.objects.bulk_create([
+            Reservation(
+                room=self.room, floor=self.floor, individual=(self.user, neighbour)[index % 2],
+                reservation_time=window_start + index * timedelta(minutes=10), duration=timedelta(minutes=10),
+                end_time=window_start + (index + 1) * timedelta(minutes=10)
+            )
+            for index in range(1000)
+        ])
+
+        response = self.assertGetQueries(1, '/api/reservations/?page_size=1000', **self.bearer(self.user))
+        self.assertEqual(len(response.data['results']), 1000)
+        self.assertEqual(response.data['results'][1]['individual_name'], 'Ana Pop')
+
+    def test_next_cursor_walks_every_page(self):
+        neighbour = Room.objects.create(floor=self.floor, room_number=102)
+        start = bookable_time(10)
+        for offset in (0, 60, 60, 120, 180):
+            # Two bookings share a start time, so the id breaks the tie
+            self.reserve(start + timedelta(minutes=offset), minutes=40, room=neighbour if offset == 60 else None)
+        expected = [
+            str(pk) for pk in Reservation.objects.order_by('reservation_time', 'id').values_list('pk', flat=True)
+        ]
+
+        seen, path = [], '/api/reservations/?page_size=2'
+        while path:
+            response = self.client.get(path, **self.bearer(self.user))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(reservation['id'] for reservation in response.data['results'])
+            path = response.data['next']
+        self.assertEqual(seen, expected)
+
+    def test_malformed_window(self):
+        for query in ('?from=tomorrow', '?to=2030-13-01', '?from=2030-01-07T25:00'):
+            response = self.client.get('/api/reservations/' + query, **self.bearer(self.user))
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.data), [query[1:query.index('=')]])
+
+
+class ReservationListETagTests(ReservationTestCase):
+    def test_unchanged_list_is_not_modified(self):
+        headers = self.bearer(self.user)
+        self.reserve(bookable_time(10))
+        etag = self.client.get('/api/reservations/', **headers)['ETag']
+
+        # Answered from the version counter alone, without the reservation query
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/reservations/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserve(bookable_time(12))
+        response = self.client.get('/api/reservations/', HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+class FloorAdminQueryTests(ReservationTestCase):
+    def test_changelist_queries_do_not_grow_with_floors(self):
+        admin = Individual.objects.create_superuser('admin', password='secret')
+        self.client.force_login(admin)
+        for number in range(2, 51):
+            floor = Floor.objects.create(floor_number=number)
+            Room.objects.create(floor=floor, room_number=number * 100 + 1)
+        self.reserve(timezone.now() - timedelta(minutes=10))
+
+        # Session, user, Floor Admins check, rollup watermark, two counts and one annotated
+        # floor query; nothing per row
+        response = self.assertGetQueries(7, '/admin/reservations/floor/')
+        self.assertEqual(len(response.context['cl'].result_list), 50)
+
+
+class RoomAdminQueryTests(ReservationTestCase):
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/reservations/room/?all=')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_occupants_prefetched_for_every_row(self):
+        self.client.force_login(Individual.objects.create_superuser('admin', password='secret'))
+        few, _ = self.changelist_queries()
+
+        for number in range(2, 40):
+            room = Room.objects.create(floor=self.floor, room_number=100 + number)
+            Individual.objects.create_user(f'resident{number}', room=room)
+        many, response = self.changelist_queries()
+
+        self.assertEqual(many, few)
+        self.assertContains(response, 'resident39')
+        self.assertEqual(len(response.context['cl'].result_list), 39)
+
+
+class WeeklyUsageCounterTests(ReservationTestCase):
+    def minutes(self, week_day=0, room=None):
+        """The stored counter of the room's week containing self.at(week_day, ...)."""
+        week_start = self.at(week_day, 0).date() - timedelta(days=week_day % 7)
+        counter = RoomWeeklyUsage.objects.filter(room=room or self.room, week_start=week_start).first()
+        return counter.reserved_minutes if counter else 0
+
+    def reconcile(self, *args):
+        output = StringIO()
+        call_command('reconcile_weekly_usage', *args, stdout=output)
+        return output.getvalue()
+
+    def test_create_update_and_delete(self):
+        reservation = self.reserve(self.at(0, 10), minutes=60)
+        self.reserve(self.at(2, 10), minutes=40)
+        self.assertEqual(self.minutes(), 100)
+
+        reservation = Reservation.objects.get(pk=reservation.pk)
+        reservation.duration = timedelta(minutes=90)
+        reservation.save()
+        self.assertEqual(self.minutes(), 130)
+
+        reservation.delete()
+        self.assertEqual(self.minutes(), 40)
+
+    def test_partial_minutes_round_up(self):
+        self.reserve(self.at(0, 10), minutes=40)
+        Reservation.objects.create(
+            room=self.room, individual=self.user, reservation_time=self.at(1, 10),
+            duration=timedelta(minutes=40, seconds=1)
+        )
+        self.assertEqual(self.minutes(), 81)
+
+    def test_move_to_another_week_and_room(self):
+        other_room = Room.objects.create(floor=self.floor, room_number=102)
+        reservation = Reservation.objects.get(pk=self.reserve(self.at(0, 10), minutes=60).pk)
+
+        reservation.reservation_time = self.at(8, 10)
+        reservation.save()
+        self.assertEqual((self.minutes(0), self.minutes(7)), (0, 60))
+
+        reservation.room = other_room
+        reservation.save()
+        self.assertEqual(self.minutes(7), 0)
+        self.assertEqual(self.minutes(7, other_room), 60)
+
+    def test_update_without_stored_values_recounts_the_week(self):
+        reservation = self.reserve(self.at(0, 10), minutes=60)
+        # Loaded without its duration, so the stored time can't be credited back
+        reservation = Reservation.objects.defer('duration').get(pk=reservation.pk)
+        reservation.duration = timedelta(minutes=45)
+        reservation.save()
+        self.assertEqual(self.minutes(), 45)
+
+    def test_bulk_endpoint_charges_counters(self):
+        start = bookable_time(10)
+        self.reserve(start - timedelta(hours=2), minutes=40)
+
+        response = self.client.post('/api/reservations/bulk/', json.dumps({'reservations': [
+            {'reservation_time': start.isoformat(), 'duration': '01:00:00'},
+            {'reservation_time': (start + timedelta(hours=2)).isoformat(), 'duration': '01:00:00'},
+            {'reservation_time': (start + timedelta(hours=4)).isoformat(), 'duration': '02:00:00'},
+        ]}), content_type='application/json', **self.bearer(self.user))
+        self.assertEqual(response.status_code, 201)
+        # The last one would break the 4 hour quota
+        self.assertEqual([item['status'] for item in response.data['results']], ['accepted', 'accepted', 'rejected'])
+
+        counter = RoomWeeklyUsage.objects.get(room=self.room)
+        self.assertEqual(counter.reserved_minutes, 160)
+
+    def test_reconcile_repairs_drift(self):
+        self.reserve(self.at(0, 10), minutes=60)
+        self.reserve(self.at(7, 10), minutes=40)
+        RoomWeeklyUsage.objects.filter(week_start=self.at(0, 0).date()).update(reserved_minutes=5)
+        RoomWeeklyUsage.objects.filter(week_start=self.at(7, 0).date()).delete()
+        RoomWeeklyUsage.objects.create(room=self.room, week_start=self.at(14, 0).date(), reserved_minutes=30)
+
+        self.assertIn("Dry run: 3 counter(s) drifted", self.reconcile('--dry-run'))
+        self.assertEqual(self.minutes(0), 5)
+
+        self.assertIn("3 had drifted", self.reconcile())
+        self.assertEqual((self.minutes(0), self.minutes(7), self.minutes(14)), (60, 40, 0))
+        self.assertIn("0 had drifted", self.reconcile())
+
+
+class BulkReservationTests(ReservationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.neighbour = Room.objects.create(floor=self.floor, room_number=102)
+
+    def post_bulk(self, payload):
+        return self.client.post(
+            '/api/reservations/bulk/', json.dumps(payload), content_type='application/json', **self.bearer(self.user)
+        )
+
+    def item(self, start, duration='01:00:00'):
+        return {'reservation_time': start.isoformat(), 'duration': duration}
+
+    def test_partially_valid_batch(self):
+        start = bookable_time(10)
+        self.reserve(start + timedelta(hours=3), room=self.neighbour)
+
+        response = self.post_bulk({'reservations': [
+            self.item(start),
+            self.item(start + timedelta(hours=3, minutes=30)),
+            self.item(start, duration='00:10:00'),
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([item['status'] for item in response.data['results']], ['accepted', 'rejected', 'rejected'])
+        self.assertEqual(response.data['results'][1]['error'], OVERLAP_ERROR.format(floor_number=1))
+        self.assertEqual(response.data['results'][0]['id'], Reservation.objects.get(room=self.room).pk)
+
+    def test_overlap_within_the_batch(self):
+        start = bookable_time(10)
+        response = self.post_bulk({'reservations': [self.item(start), self.item(start + timedelta(minutes=30))]})
+        self.assertEqual([item['status'] for item in response.data['results']], ['accepted', 'rejected'])
+        self.assertEqual(response.data['results'][1]['error'], OVERLAP_ERROR.format(floor_number=1))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_recurrence_crossing_the_window(self):
+        start = bookable_time(10)
+        window_end = booking_window()[1]
+        response = self.post_bulk({'recurrence': {'start': start.isoformat(), 'duration': '01:00:00', 'count': 3}})
+
+        occurrences = [
+            BUCHAREST_TZ.localize(datetime.combine(start.date() + timedelta(weeks=week), start.time())) for week in range(3)
+        ]
+        expected = ['accepted' if occurrence < window_end else 'rejected' for occurrence in occurrences]
+        self.assertIn('rejected', expected)
+        self.assertEqual([item['status'] for item in response.data['results']], expected)
+        for item in response.data['results']:
+            if item['status'] == 'rejected':
+                self.assertEqual(item['error'], "Reservations can only be made within the current and next week.")
+        self.assertEqual(Reservation.objects.count(), expected.count('accepted'))
+
+    @override_settings(RESERVATION_REQUEST_WINDOW=True)
+    def test_pending_items_do_not_block_the_rest_of_the_batch(self):
+        next_monday = week_bounds(timezone.now())[1] + timedelta(hours=10)
+        response = self.post_bulk({'reservations': [
+            self.item(next_monday), self.item(next_monday + timedelta(minutes=30))
+        ]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['error'] for item in response.data['results']], [PENDING_ALLOCATION_ERROR] * 2)
+
+
+@override_settings(RESERVATION_REQUEST_WINDOW=True)
+class RequestWindowTests(ReservationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.week_start = request_week()
+        self.monday = week_bounds_of(self.week_start)[0]
+        self.neighbour = Room.objects.create(floor=self.floor, room_number=102)
+        self.other = Individual.objects.create_user('neighbour', password='secret', room=self.neighbour)
+
+    def prefer(self, room, rank, start, minutes=60):
+        return SlotPreference(
+            room=room, individual=self.user, week_start=self.week_start, rank=rank,
+            reservation_time=start, duration=timedelta(minutes=minutes)
+        )
+
+    def test_competing_rooms_take_turns(self):
+        slots = [self.monday + timedelta(hours=hour) for hour in (10, 11, 12, 13)]
+        preferences = {
+            room.pk: [self.prefer(room, rank, start) for rank, start in enumerate(slots, start=1)]
+            for room in (self.room, self.neighbour)
+        }
+        allocated, rejected = allocate_floor(preferences, FloorIntervals(), {}, seed='test')
+
+        self.assertEqual([preference.reservation_time for preference in allocated], slots)
+        winners = [preference.room_id for preference in allocated]
+        self.assertEqual(winners[0::2], [winners[0]] * 2)
+        self.assertEqual(winners[1::2], [winners[1]] * 2)
+        self.assertNotEqual(winners[0], winners[1])
+        self.assertEqual(len(rejected), 4)
+
+    def test_quota_overflow_is_skipped(self):
+        preferences = {self.room.pk: [
+            self.prefer(self.room, 1, self.monday + timedelta(hours=8), minutes=180),
+            self.prefer(self.room, 2, self.monday + timedelta(hours=12), minutes=120),
+            self.prefer(self.room, 3, self.monday + timedelta(hours=15), minutes=60),
+        ]}
+        allocated, rejected = allocate_floor(preferences, FloorIntervals(), {}, seed='test')
+        self.assertEqual([preference.rank for preference in allocated], [1, 3])
+        self.assertEqual([preference.rank for preference in rejected], [2])
+
+    def test_allocation_books_the_week_once(self):
+        preference = SlotPreference.objects.create(
+            room=self.room, individual=self.user, week_start=self.week_start, rank=1,
+            reservation_time=self.monday + timedelta(hours=10), duration=timedelta(hours=1)
+        )
+        output = StringIO()
+        call_command('allocate_reservations', stdout=output)
+        self.assertIn("1 preference(s) granted, 0 rejected", output.getvalue())
+
+        preference.refresh_from_db()
+        self.assertEqual(preference.status, SlotPreference.ALLOCATED)
+        self.assertEqual(preference.reservation.reservation_time, preference.reservation_time)
+        self.assertEqual(RoomWeeklyUsage.objects.get(room=self.room, week_start=self.week_start).reserved_minutes, 60)
+
+        with self.assertRaises(CommandError):
+            call_command('allocate_reservations', stdout=StringIO())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            allocate_week(self.week_start)
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def item(self, hour):
+        return {'reservation_time': (self.monday + timedelta(hours=hour)).isoformat(), 'duration': '01:00:00'}
+
+    def test_direct_booking_waits_for_allocation(self):
+        payload = json.dumps(self.item(10))
+        response = self.client.post(
+            '/api/reservations/', payload, content_type='application/json', **self.bearer(self.user)
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(PENDING_ALLOCATION_ERROR, str(response.data))
+
+        AllocationRun.objects.create(week_start=self.week_start)
+        response = self.client.post(
+            '/api/reservations/', payload, content_type='application/json', **self.bearer(self.user)
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_preferences_close_once_allocated(self):
+        payload = json.dumps([self.item(10)])
+        response = self.client.post(
+            '/api/reservations/preferences/', payload, content_type='application/json', **self.bearer(self.user)
+        )
+        self.assertEqual(response.status_code, 201)
+
+        AllocationRun.objects.create(week_start=self.week_start)
+        response = self.client.post(
+            '/api/reservations/preferences/', payload, content_type='application/json', **self.bearer(self.user)
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(SlotPreference.objects.count(), 1)
+
+
+class UtilisationReportTests(ReservationTestCase):
+    """Compare the heatmap with walking every reservation and window hour by hour in local time."""
+
+    def local(self, month, day, hour, minute=0):
+        return BUCHAREST_TZ.localize(datetime(2030, month, day, hour, minute))
+
+    def setUp(self):
+        super().setUp()
+        self.reservations = [
+            self.reserve(self.local(3, 18, 10, 30), 60),  # Crosses an hour boundary
+            self.reserve(self.local(3, 19, 12), 240),
+            self.reserve(self.local(3, 27, 15, 45), 80),
+            self.reserve(self.local(3, 30, 21, 20), 90),  # Clocks go forward the next night
+            self.reserve(self.local(4, 1, 7), 40),
+        ]
+        self.reserve(self.local(4, 8, 9), 60)  # After the window
+        self.window = (self.local(3, 18, 0), self.local(4, 8, 0))
+
+    def brute_force(self):
+        reserved, available = np.zeros((7, 24)), np.zeros((7, 24))
+        for reservation in self.reservations:
+            moment = reservation.reservation_time
+            while moment < reservation.end_time:
+                # Bucharest's offset is whole hours, so UTC hours are local hours
+                hour_end = min(moment.replace(minute=0, second=0) + timedelta(hours=1), reservation.end_time)
+                local = moment.astimezone(BUCHAREST_TZ)
+                reserved[local.weekday(), local.hour] += (hour_end - moment).total_seconds() / 60
+                moment = hour_end
+        moment = self.window[0]
+        while moment < self.window[1]:
+            local = moment.astimezone(BUCHAREST_TZ)
+            available[local.weekday(), local.hour] += 60
+            moment += timedelta(hours=1)
+        # The week the clocks go forward has no 3:00 on Sunday
+        self.assertEqual(available[6, 3], 120)
+        return reserved, reserved / available
+
+    def assertMatchesBruteForce(self, report):
+        reserved, utilisation = self.brute_force()
+        self.assertEqual(report['reservations'], len(self.reservations))
+        self.assertEqual(report['heatmap']['reserved_minutes'], np.round(reserved).astype(int).tolist())
+        np.testing.assert_allclose(report['heatmap']['utilisation'], utilisation, atol=0.0005)
+
+    def test_live_reservations(self):
+        self.assertMatchesBruteForce(utilisation_report(*self.window))
+
+    def test_rolled_up_reservations(self):
+        refresh_floor_usage(now=timezone.now() + timedelta(hours=1))
+        self.assertMatchesBruteForce(utilisation_report(*self.window))
+
+
+class FloorAdminScopeTests(ReservationTestCase):
+    """Floor Admins only see and change the objects on the floor they administer."""
+
+    def setUp(self):
+        super().setUp()
+        self.other_floor = Floor.objects.create(floor_number=2)
+        self.other_room = Room.objects.create(floor=self.other_floor, room_number=201)
+        self.own = self.reserve(bookable_time(10))
+        self.foreign = self.reserve(bookable_time(12), room=self.other_room)
+
+        group = Group.objects.create(name=FLOOR_ADMINS_GROUP)
+        group.permissions.set(Permission.objects.filter(
+            content_type__app_label='reservations', codename__regex=r'^(view|change|delete)_(reservation|room)$'
+        ))
+        admin_user = Individual.objects.create_user(
+            'floor-admin', password='secret', is_staff=True, admin_floor=self.floor.pk
+        )
+        admin_user.groups.add(group)
+        self.client.force_login(admin_user)
+
+    def test_changelists_show_only_their_floor(self):
+        response = self.client.get('/admin/reservations/reservation/')
+        self.assertEqual(list(response.context['cl'].queryset), [self.own])
+        response = self.client.get('/admin/reservations/room/')
+        self.assertEqual(list(response.context['cl'].queryset), [self.room])
+
+    def test_cannot_open_or_change_another_floors_objects(self):
+        for path in (
+            f'/admin/reservations/reservation/{self.foreign.pk}/change/',
+            f'/admin/reservations/room/{self.other_room.pk}/change/',
+        ):
+            # The admin treats objects outside the queryset as missing
+            self.assertRedirects(self.client.get(path), '/admin/')
+
+        response = self.client.post(f'/admin/reservations/reservation/{self.foreign.pk}/delete/', {'post': 'yes'})
+        self.assertRedirects(response, '/admin/')
+        self.assertTrue(Reservation.objects.filter(pk=self.foreign.pk).exists())
+
+        self.assertEqual(
+            self.client.get(f'/admin/reservations/reservation/{self.own.pk}/change/').status_code, 200
+        )
+
+
+class ArchiveTests(ReservationTestCase):
+    def setUp(self):
+        super().setUp()
+        this_week = booking_window()[0]
+        self.old = [self.reserve(this_week - timedelta(weeks=weeks, days=-1, hours=-10)) for weeks in (6, 5, 5)]
+        self.recent = self.reserve(this_week - timedelta(weeks=1, days=-1, hours=-10))
+        self.preference = SlotPreference.objects.create(
+            room=self.room, individual=self.user, week_start=this_week.date() - timedelta(weeks=6), rank=1,
+            reservation_time=self.old[0].reservation_time, duration=self.old[0].duration, reservation=self.old[0]
+        )
+
+    def archive(self, *args):
+        output = StringIO()
+        call_command('archive_reservations', '--weeks', '4', *args, stdout=output)
+        return output.getvalue()
+
+    def rollup(self):
+        return sorted(FloorHourlyUsage.objects.filter(reserved_seconds__gt=0).values_list(
+            'week_start', 'hour', 'reserved_seconds', 'reservations'
+        ))
+
+    def test_requires_a_rolled_up_history(self):
+        with self.assertRaises(CommandError):
+            self.archive()
+
+    def test_moves_only_old_rolled_up_reservations(self):
+        refresh_floor_usage(now=timezone.now() + timedelta(hours=1))
+
+        self.assertIn("3 reservation(s)", self.archive('--dry-run'))
+        self.assertEqual(ReservationArchive.objects.count(), 0)
+
+        self.assertIn("Archived 3 reservation(s)", self.archive('--batch-size', '2'))
+        self.assertEqual(list(Reservation.objects.values_list('pk', flat=True)), [self.recent.pk])
+        self.assertEqual(
+            set(ReservationArchive.objects.values_list('pk', flat=True)), {reservation.pk for reservation in self.old}
+        )
+        archived = ReservationArchive.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.room_id, archived.end_time), (self.room.pk, self.old[0].end_time))
+        self.preference.refresh_from_db()
+        self.assertIsNone(self.preference.reservation_id)
+
+    def test_history_still_counts_after_archiving(self):
+        refresh_floor_usage(now=timezone.now() + timedelta(hours=1))
+        counters = sorted(RoomWeeklyUsage.objects.values_list('week_start', 'reserved_minutes'))
+        rollup = self.rollup()
+        self.archive()
+
+        output = StringIO()
+        call_command('reconcile_weekly_usage', stdout=output)
+        self.assertIn("0 had drifted", output.getvalue())
+        self.assertEqual(sorted(RoomWeeklyUsage.objects.values_list('week_start', 'reserved_minutes')), counters)
+
+        refresh_floor_usage(now=timezone.now() + timedelta(hours=1), rebuild=True)
+        self.assertEqual(self.rollup(), rollup)
+        self.assertEqual(export_queryset(None, None).count(), 4)
+
+
+class FloorEventTests(ReservationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        async def subscribe():
+            return broker.subscribe(self.floor.pk, maxsize)
+
+        subscription = self.loop.run_until_complete(subscribe())
+        self.addCleanup(broker.unsubscribe, subscription)
+        return subscription
+
+    def receive(self, subscription):
+        return self.loop.run_until_complete(subscription.get(1))
+
+    def test_created_and_deleted_payloads(self):
+        subscription = self.subscribe()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = self.reserve(bookable_time(10))
+        expected = {
+            'id': str(reservation.pk),
+            'floor': self.floor.pk,
+            'reservation_time': reservation.reservation_time.isoformat(),
+            'end_time': reservation.end_time.isoformat(),
+        }
+        self.assertEqual(self.receive(subscription), {'type': 'created', **expected})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertEqual(self.receive(subscription), {'type': 'deleted', **expected})
+
+    def test_slow_subscriber_is_told_to_resync(self):
+        subscription = self.subscribe(maxsize=3)
+        started = timezone.now() - timedelta(hours=1)
+        events = [
+            {'type': 'created', 'id': str(number), 'floor': self.floor.pk, 'reservation_time': started.isoformat()}
+            for number in range(5)
+        ]
+        for event in events:
+            broker.publish(self.floor.pk, event)
+        # publish() hands events over through the loop, so let it run once
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(subscription.lagging)
+
+        stream = event_stream(subscription, [])
+        self.addCleanup(self.loop.run_until_complete, stream.aclose())
+        chunks = [self.loop.run_until_complete(anext(stream)) for _ in range(4)]
+        self.assertEqual(chunks[:2], [": connected\n\n", format_event({'type': 'resync', 'floor': self.floor.pk})])
+        # The oldest events were dropped, the newest kept in order
+        self.assertEqual(chunks[2:], [format_event(event) for event in events[2:4]])
+        self.assertFalse(subscription.lagging)
+
+    def test_only_safe_methods(self):
+        response = self.client.post(f'/api/floors/{self.floor.pk}/events/', **self.bearer(self.user))
+        self.assertEqual(response.status_code, 405)
+
+
+class ExportTests(ReservationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = Individual.objects.create_user('warden', password='secret', is_staff=True)
+        self.reservations = [self.reserve(self.at(day, 10)) for day in (0, 1, 8)]
+
+    def export(self, export_format, query=''):
+        response = self.client.get(
+            f'/api/reservations/export/?export_format={export_format}{query}', **self.bearer(self.staff)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], EXPORT_FORMATS[export_format][1])
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.export('csv', '&from=2030-01-07&to=2030-01-14'))))
+        self.assertEqual(rows[0], list(EXPORT_COLUMNS))
+        self.assertEqual([row[0] for row in rows[1:]], [str(reservation.pk) for reservation in self.reservations[:2]])
+        self.assertEqual(rows[1][2:4], ['101', 'resident'])
+        self.assertEqual(rows[1][-2], '60')
+
+        # An empty window still gets the header row
+        self.assertEqual(list(csv.reader(StringIO(self.export('csv', '&from=2031-01-01')))), [list(EXPORT_COLUMNS)])
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export('ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [str(reservation.pk) for reservation in self.reservations])
+        self.assertEqual(datetime.fromisoformat(rows[0]['reservation_time']), self.reservations[0].reservation_time)
+        self.assertEqual(self.export('ndjson', '&to=2000-01-01'), '')
+
+    def test_malformed_bound(self):
+        response = self.client.get('/api/reservations/export/?from=monday', **self.bearer(self.staff))
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        output = StringIO()
+        call_command('export_reservations', '--format', 'ndjson', '--from', '2030-01-14', stdout=output)
+        self.assertEqual(
+            [json.loads(line)['id'] for line in output.getvalue().splitlines()], [str(self.reservations[2].pk)]
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'reservations.csv'
+            call_command('export_reservations', '--output', str(path), '--to', '2030-01-01')
+            self.assertEqual(path.read_text(encoding='utf-8').splitlines(), [','.join(EXPORT_COLUMNS)])
+
+        with self.assertRaisesMessage(CommandError, "--from: Expected an ISO 8601 date or datetime."):
+            call_command('export_reservations', '--from', 'monday')
+
+
+class AsyncReadViewTests(ReservationTestCase):
+    def test_only_safe_methods(self):
+        headers = self.bearer(self.user)
+        reservation = self.reserve(bookable_time(10))
+        for path in (
+            '/api/async/reservations/', f'/api/async/reservations/{reservation.pk}/',
+            f'/api/async/floors/{self.floor.pk}/availability/',
+        ):
+            self.assertEqual(self.client.get(path, **headers).status_code, 200)
+            self.assertEqual(self.client.post(path, **headers).status_code, 405)
+            self.assertEqual(self.client.delete(path, **headers).status_code, 405)
+
+    def test_list_matches_the_sync_endpoint(self):
+        other_floor = Floor.objects.create(floor_number=2)
+        self.reserve(bookable_time(10))
+        self.reserve(bookable_time(12))
+        self.reserve(bookable_time(10), room=Room.objects.create(floor=other_floor, room_number=201))
+        headers = self.bearer(self.user)
+
+        query = '?from=' + bookable_time(11).date().isoformat()
+        sync = self.client.get('/api/reservations/' + query, **headers)
+        response = self.client.get('/api/async/reservations/' + query, **headers)
+        self.assertEqual(json.loads(response.content)['results'], json.loads(sync.content)['results'])
+        self.assertEqual(len(sync.data['results']), 2)
+
+        response = self.client.get('/api/async/reservations/' + query, HTTP_IF_NONE_MATCH=response['ETag'], **headers)
+        self.assertEqual(response.status_code, 304)
+
+    def test_malformed_window_is_rejected_before_the_etag(self):
+        headers = self.bearer(self.user)
+        for path in ('/api/reservations/', '/api/async/reservations/'):
+            response = self.client.get(path + '?from=soon', HTTP_IF_NONE_MATCH='*', **headers)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('from', json.loads(response.content))
+
+    def test_availability_served_from_the_warm_index(self):
+        headers = self.bearer(self.user)
+        path = f'/api/async/floors/{self.floor.pk}/availability/'
+        availability_index.get(self.floor.pk)
+        with self.assertNumQueries(0):
+            response = self.client.get(path, **headers)
+        self.assertEqual(response.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = self.reserve(bookable_time(10))
+        free = json.loads(self.client.get(path, **headers).content)['free']
+        self.assertFalse(any(
+            datetime.fromisoformat(slot['start']) <= reservation.reservation_time < datetime.fromisoformat(slot['end'])
+            for slot in free
+        ))
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import FloorViewSet, RoomViewSet, IndividualViewSet, WashingMachineRoomViewSet, ReservationViewSet
+from .streams import floor_events
+from .async_views import floor_availability, reservation_detail, reservation_list
 
 
 
@@ -12,6 +14,12 @@ router.register(r'washingmachinerooms', WashingMachineRoomViewSet)
 router.register(r'reservations', ReservationViewSet, basename='reservation')
 
 urlpatterns = [
+    # Server-Sent Events feed, needs the ASGI application
+    path('floors/<int:floor_id>/events/', floor_events, name='floor-events'),
+    # Async-native read endpoints, served without a thread hop under ASGI
+    path('async/reservations/', reservation_list, name='async-reservation-list'),
+    path('async/reservations/<uuid:pk>/', reservation_detail, name='async-reservation-detail'),
+    path('async/floors/<int:floor_id>/availability/', floor_availability, name='async-floor-availability'),
     path('', include(router.urls)),
     # Auth endpoints
 ]
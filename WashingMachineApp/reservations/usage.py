@@ -0,0 +1,94 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .archive import reservation_history
+from .models import RoomWeeklyUsage, usage_minutes
+from .validation import week_bounds, week_bounds_of
+
+
+def usage_key(room_id, reservation_time):
+    """The (room id, week start date) counter a reservation is charged to."""
+    return room_id, week_bounds(reservation_time)[0].date()
+
+
+def count_week(room_id, week_start):
+    """Sum a room's reserved minutes for one week straight from its live and archived reservations."""
+    range_start, range_end = week_bounds_of(week_start)
+    durations = reservation_history(
+        ('duration',), room_id=room_id, reservation_time__gte=range_start, reservation_time__lt=range_end
+    )
+    return sum(usage_minutes(duration) for (duration,) in durations)
+
+
+def recount(room_id, week_start):
+    RoomWeeklyUsage.objects.update_or_create(
+        room_id=room_id, week_start=week_start,
+        defaults={'reserved_minutes': count_week(room_id, week_start)}
+    )
+
+
+def apply_usage(deltas):
+    """Add {(room id, week start): minutes} to the counters with F() increments."""
+    deltas = {key: minutes for key, minutes in deltas.items() if minutes}
+    if len(deltas) > 1:
+        # Batches (bulk booking, allocation) mostly charge weeks without a counter yet:
+        # create those in one statement and only increment the ones that exist
+        existing = set(RoomWeeklyUsage.objects.filter(
+            room_id__in={room_id for room_id, _ in deltas}, week_start__in={week_start for _, week_start in deltas}
+        ).values_list('room_id', 'week_start'))
+        missing = [
+            RoomWeeklyUsage(room_id=room_id, week_start=week_start, reserved_minutes=minutes)
+            for (room_id, week_start), minutes in deltas.items() if (room_id, week_start) not in existing and minutes > 0
+        ]
+        try:
+            with transaction.atomic():
+                RoomWeeklyUsage.objects.bulk_create(missing, batch_size=1000)
+        except IntegrityError:
+            pass  # Another transaction created some of them; fall back to one counter at a time
+        else:
+            deltas = {key: minutes for key, minutes in deltas.items() if key in existing}
+
+    for (room_id, week_start), minutes in deltas.items():
+        counter = RoomWeeklyUsage.objects.filter(room_id=room_id, week_start=week_start)
+        if counter.update(reserved_minutes=F('reserved_minutes') + minutes):
+            continue
+
+        if minutes < 0:
+            # No counter to take time off (e.g. it was deleted along with its room)
+            continue
+        try:
+            with transaction.atomic():
+                RoomWeeklyUsage.objects.create(room_id=room_id, week_start=week_start, reserved_minutes=minutes)
+        except IntegrityError:
+            # Another transaction created the row first
+            counter.update(reserved_minutes=F('reserved_minutes') + minutes)
+
+
+def remember_usage(reservation):
+    reservation._stored_usage = (reservation.room_id, reservation.reservation_time, reservation.duration)
+
+
+def reservations_saved(reservations, created=True):
+    """Charge saved reservations to their weeks, moving any previously stored time off its old week."""
+    deltas = Counter()
+    for reservation in reservations:
+        stored = getattr(reservation, '_stored_usage', None)
+        if not created and stored is None:
+            # Saved without its stored values being loaded; the old week can't be credited,
+            # so rebuild the new one and leave the rest to reconcile_weekly_usage
+            recount(*usage_key(reservation.room_id, reservation.reservation_time))
+        else:
+            if stored is not None:
+                deltas[usage_key(stored[0], stored[1])] -= usage_minutes(stored[2])
+            deltas[usage_key(reservation.room_id, reservation.reservation_time)] += usage_minutes(reservation.duration)
+        remember_usage(reservation)
+    apply_usage(deltas)
+
+
+def reservation_removed(reservation):
+    room_id, reservation_time, duration = getattr(
+        reservation, '_stored_usage', (reservation.room_id, reservation.reservation_time, reservation.duration)
+    )
+    apply_usage({usage_key(room_id, reservation_time): -usage_minutes(duration)})
@@ -0,0 +1,168 @@
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta, time
+from functools import lru_cache
+
+import pytz
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .intervals import FloorIntervals
+from .models import RoomWeeklyUsage, usage_minutes
+
+# Built once at import time instead of on every validation call
+BUCHAREST_TZ = pytz.timezone('Europe/Bucharest')
+
+MIN_DURATION = timedelta(minutes=40)
+MAX_DURATION = timedelta(hours=4)
+WEEKLY_LIMIT = timedelta(hours=4)
+START_OF_DAY = time(7, 0)  # 7:00 AM
+END_OF_DAY = time(23, 0)  # 11:00 PM
+
+OVERLAP_ERROR = "Another room on floor {floor_number} already has a reservation during this time."
+WEEKLY_LIMIT_ERROR = "Room {room_number} cannot have more than 4 hours of reservations per week."
+
+ConflictCheck = namedtuple('ConflictCheck', ['has_overlap', 'weekly_total'])  # weekly_total excludes the booking itself
+
+
+@lru_cache(maxsize=32)
+def _week_bounds_for(monday):
+    """Localized [start, end) datetimes of the week starting on the given Monday."""
+    start = BUCHAREST_TZ.localize(datetime.combine(monday, time.min))
+    end = BUCHAREST_TZ.localize(datetime.combine(monday + timedelta(days=7), time.min))
+    return start, end
+
+
+def week_bounds_of(week_start):
+    """Return the [start, end) datetimes of the week beginning on the given Monday date."""
+    return _week_bounds_for(week_start)
+
+
+def week_bounds(value):
+    """Return the Monday 00:00 to next Monday 00:00 (Bucharest time) window containing value."""
+    local_date = value.astimezone(BUCHAREST_TZ).date()
+    return _week_bounds_for(local_date - timedelta(days=local_date.weekday()))
+
+
+def booking_window(now=None):
+    """Return the [start of this week, start of the week after next) booking window."""
+    this_week_start, next_week_start = week_bounds(now or timezone.now())
+    return this_week_start, _week_bounds_for(next_week_start.date())[1]
+
+
+def parse_window_bound(value, name):
+    """Parse a ?from=/?to= value given as an ISO date or datetime."""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is not None:
+                parsed = datetime.combine(parsed_date, time.min)
+    except ValueError:
+        parsed = None
+
+    if parsed is None:
+        raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+    if timezone.is_naive(parsed):
+        parsed = BUCHAREST_TZ.localize(parsed)
+    return parsed
+
+
+def schedule_error(reservation_time, duration, now=None):
+    """Return the first rule the booking breaks that needs no database access, or None."""
+    now = now or timezone.now()
+
+    # Validation 1: Ensure the duration is between 40 minutes and 4 hours
+    if duration < MIN_DURATION:
+        return "Reservations must be at least 40 minutes long."
+    if duration > MAX_DURATION:
+        return "Reservations cannot exceed 4 hours (240 minutes)."
+
+    # Validation 4: No reservations in the past
+    if reservation_time < now:
+        return "Reservations cannot be made in the past."
+
+    # Validation 5: No reservations on Sundays
+    local_start = reservation_time.astimezone(BUCHAREST_TZ)
+    if local_start.weekday() == 6:
+        return "Reservations cannot be made on Sundays."
+
+    # Validation 6: Ensure reservation is within working hours (7:00 AM to 11:00 PM)
+    if not (START_OF_DAY <= local_start.time() <= END_OF_DAY):
+        return "Reservations can only start between 7:00 AM and 11:00 PM."
+    if not (START_OF_DAY <= (reservation_time + duration).astimezone(BUCHAREST_TZ).time() <= END_OF_DAY):
+        return "Reservations must end by 11:00 PM."
+
+    # Validation 7: Ensure reservation is within this week or next week
+    window_start, window_end = booking_window(now)
+    if not (window_start <= reservation_time < window_end):
+        return "Reservations can only be made within the current and next week."
+
+    return None
+
+
+def check_conflicts(room, reservation_time, duration, exclude=None):
+    """
+    Run the floor overlap check through FloorIntervals and read the weekly quota from its counter.
+
+    Only the floor's reservations touching the booking are loaded for the overlap
+    check. The quota comes from the room's RoomWeeklyUsage row for the booking's week
+    rather than from summing its reservations. When exclude (the reservation being
+    updated) is charged to the same week, its stored time is taken off the total.
+    """
+    reservation_end_time = reservation_time + duration
+    week_start = week_bounds(reservation_time)[0].date()
+
+    intervals = FloorIntervals.load(
+        room.floor_id, reservation_time, reservation_end_time, exclude_pk=exclude.pk if exclude is not None else None
+    )
+    reserved_minutes = RoomWeeklyUsage.objects.filter(room=room, week_start=week_start).values_list(
+        'reserved_minutes', flat=True
+    ).first() or 0
+
+    stored = getattr(exclude, '_stored_usage', None)
+    if stored is not None and stored[0] == room.pk and week_bounds(stored[1])[0].date() == week_start:
+        reserved_minutes -= usage_minutes(stored[2])
+
+    return ConflictCheck(intervals.overlaps(reservation_time, reservation_end_time), timedelta(minutes=reserved_minutes))
+
+
+def check_batch(room, candidates, now=None):
+    """
+    Validate many (reservation_time, duration) candidates for one room with two queries.
+
+    The floor's reservations spanning the batch and the room's weekly usage counters
+    are loaded once, and the overlap and weekly quota rules are then checked in memory,
+    treating candidates accepted earlier in the batch as booked. Returns an error message or None per candidate.
+    """
+    errors = [schedule_error(reservation_time, duration, now) for reservation_time, duration in candidates]
+    valid = [candidate for candidate, error in zip(candidates, errors) if error is None]
+    if not valid:
+        return errors
+
+    intervals = FloorIntervals.load(
+        room.floor_id,
+        min(start for start, _ in valid),
+        max(start + duration for start, duration in valid)
+    )
+    totals = defaultdict(timedelta)
+    for week_start, reserved_minutes in RoomWeeklyUsage.objects.filter(
+        room=room, week_start__in={week_bounds(start)[0].date() for start, _ in valid}
+    ).values_list('week_start', 'reserved_minutes'):
+        totals[week_start] = timedelta(minutes=reserved_minutes)
+
+    for index, (reservation_time, duration) in enumerate(candidates):
+        if errors[index] is not None:
+            continue
+
+        reservation_end_time = reservation_time + duration
+        week_start = week_bounds(reservation_time)[0].date()
+        if intervals.overlaps(reservation_time, reservation_end_time):
+            errors[index] = OVERLAP_ERROR.format(floor_number=room.floor.floor_number)
+        elif totals[week_start] + duration > WEEKLY_LIMIT:
+            errors[index] = WEEKLY_LIMIT_ERROR.format(room_number=room.room_number)
+        else:
+            intervals.add(reservation_time, reservation_end_time)
+            totals[week_start] += duration
+
+    return errors
@@ -1,23 +1,58 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from django.http import Http404
 from django.core.exceptions import ValidationError
-from .models import Floor, Room, Individual, WashingMachineRoom, Reservation
-from .serializers import FloorSerializer, RoomSerializer, IndividualSerializer, WashingMachineRoomSerializer, ReservationSerializer, IndividualRegisterSerializer
-from rest_framework.permissions import IsAuthenticated
+from .models import Floor, Room, Individual, WashingMachineRoom, Reservation, SlotPreference, AllocationRun
+from .serializers import FloorSerializer, RoomSerializer, IndividualSerializer, WashingMachineRoomSerializer, ReservationSerializer, IndividualRegisterSerializer, BulkReservationSerializer, BulkReservationItemSerializer, SlotSuggestionSerializer, SlotPreferenceSerializer, SlotPreferenceRequestSerializer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.exceptions import PermissionDenied
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework import permissions
+from .locking import run_with_floor_lock
+from .availability import availability_index, SLOT
+from .pagination import ReservationCursorPagination
+from .exports import EXPORT_FORMATS, export_queryset, export_rows
+from .validation import booking_window, check_batch, parse_window_bound
+from .signals import reservations_created
+from .usage import reservations_saved
+from .scheduling import suggest_slots
+from .analytics import utilisation_report
+from .allocation import PENDING_ALLOCATION_ERROR, allocation_pending, request_week, request_window_enabled
+from django.db import transaction
+from .caching import ALL_RESERVATIONS, CachedReadMixin, etag_matches, get_version, make_etag, not_modified, reservation_namespace
+from rest_framework.exceptions import ValidationError as APIValidationError
+from .authentication import user_floor_id
 
-class FloorViewSet(viewsets.ModelViewSet):
+class FloorViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Floor.objects.all()
     serializer_class = FloorSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=True, methods=['get'])
+    def availability(self, request, pk=None):
+        # Answered from the in-memory slot index instead of scanning reservations
+        try:
+            floor = availability_index.get(int(pk))
+        except (TypeError, ValueError):
+            floor = None
+        if floor is None:
+            raise Http404
 
-class RoomViewSet(viewsets.ModelViewSet):
-    queryset = Room.objects.all()
+        return Response({
+            'floor': floor.floor_id,
+            'window_start': floor.window_start,
+            'window_end': floor.window_end,
+            'slot_minutes': int(SLOT.total_seconds() // 60),
+            'free': [{'start': start, 'end': end} for start, end in floor.free_ranges()],
+        })
+
+
+class RoomViewSet(CachedReadMixin, viewsets.ModelViewSet):
+    queryset = Room.objects.select_related('floor')
     serializer_class = RoomSerializer
     permission_classes = [IsAuthenticated]
 
@@ -28,8 +63,8 @@ class IndividualViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class WashingMachineRoomViewSet(viewsets.ModelViewSet):
-    queryset = WashingMachineRoom.objects.all()
+class WashingMachineRoomViewSet(CachedReadMixin, viewsets.ModelViewSet):
+    queryset = WashingMachineRoom.objects.select_related('floor')
     serializer_class = WashingMachineRoomSerializer
     permission_classes = [IsAuthenticated]
 
@@ -43,22 +78,210 @@ class IndividualRegisterView(APIView):
             return Response({"message": "Registration successful"}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def listing_window(params):
+    """Return the [from, to) listing window from ?from=/?to=, defaulting to the current and next week."""
+    window_start, window_end = booking_window()
+    if params.get('from'):
+        window_start = parse_window_bound(params['from'], 'from')
+    if params.get('to'):
+        window_end = parse_window_bound(params['to'], 'to')
+    return window_start, window_end
+
+
+def visible_reservations(user, floor_id):
+    """Reservations the user may read: all of them for staff, otherwise their floor's."""
+    if floor_id is None:
+        return Reservation.objects.none()
+
+    # Join the individual up front so individual_name doesn't cost one query per row
+    queryset = Reservation.objects.select_related('individual')
+    if user.is_staff:
+        return queryset
+    return queryset.filter(floor_id=floor_id)
+
+
+def in_listing_window(queryset, window_start, window_end):
+    """Limit a reservation queryset to the window and to the columns the list serializes."""
+    return queryset.filter(
+        reservation_time__gte=window_start,
+        reservation_time__lt=window_end
+    ).only(
+        'id', 'reservation_time', 'duration', 'created_at',
+        'individual__first_name', 'individual__last_name'
+    )
+
+
+def reservation_list_namespace(user, floor_id):
+    """Version namespace behind the user's reservation list: every floor for staff, otherwise their own."""
+    return ALL_RESERVATIONS if user.is_staff else reservation_namespace(floor_id)
+
+
+def reservation_list_etag(request, namespace, version):
+    """
+    ETag of a reservation list response, given its namespace's current version.
+
+    It only changes when a reservation on the visible floor(s) changes, so polling
+    clients get a 304 without the reservation query running.
+    """
+    return make_etag(namespace, version, booking_window()[0], request.get_full_path())
+
+
 class ReservationViewSet(viewsets.ModelViewSet):
     serializer_class = ReservationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ReservationCursorPagination
+
+    def get_window(self):
+        """Return the [from, to) listing window, defaulting to the current and next week."""
+        return listing_window(self.request.query_params)
 
     def get_queryset(self):
-        user = self.request.user
+        # Staff see every reservation, everyone else their floor's
+        queryset = visible_reservations(self.request.user, user_floor_id(self.request.user))
+        if self.action == 'list':
+            queryset = in_listing_window(queryset, *self.get_window())
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        user = request.user
+        floor_id = user_floor_id(user)
+        if floor_id is None:
+            return super().list(request, *args, **kwargs)
+
+        # A malformed window is rejected even when the client's ETag would match
+        self.get_window()
+        namespace = reservation_list_namespace(user, floor_id)
+        etag = reservation_list_etag(request, namespace, get_version(namespace))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
 
-        if not user.room:
-            return Reservation.objects.none()
+    def create(self, request, *args, **kwargs):
+        # Validate and insert while holding the floor lock so concurrent bookings can't both pass validation
+        room = request.user.room
+        if not room:
+            return super().create(request, *args, **kwargs)
+        return run_with_floor_lock(room.floor_id, lambda: super(ReservationViewSet, self).create(request, *args, **kwargs))
 
-        # If the user is staff, return all reservations
-        if user.is_staff:
-            return Reservation.objects.all()
+    def update(self, request, *args, **kwargs):
+        room = request.user.room
+        if not room:
+            return super().update(request, *args, **kwargs)
+        return run_with_floor_lock(room.floor_id, lambda: super(ReservationViewSet, self).update(request, *args, **kwargs))
 
-        # Otherwise, return reservations on the user's floor
-        return Reservation.objects.filter(room__floor=user.room.floor)
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # Accept a bare list as shorthand for {"reservations": [...]}
+        data = {'reservations': request.data} if isinstance(request.data, list) else request.data
+        serializer = BulkReservationSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        room = request.user.room
+        if not room:
+            raise APIValidationError("User must be assigned to a room to make a reservation.")
+
+        items = serializer.validated_data['items']
+        return run_with_floor_lock(room.floor_id, lambda: self.create_bulk(request.user, room, items))
+
+    def create_bulk(self, user, room, items):
+        """Check the whole batch with one query and insert the accepted reservations in one statement."""
+        # Held-back items must not take up slots or quota that the rest of the batch is checked against
+        pending = [allocation_pending(reservation_time) for reservation_time, _ in items]
+        checked = iter(check_batch(room, [item for item, held in zip(items, pending) if not held]))
+        errors = [PENDING_ALLOCATION_ERROR if held else next(checked) for held in pending]
+
+        accepted = [
+            Reservation(
+                room=room, floor_id=room.floor_id, individual=user,
+                reservation_time=reservation_time, duration=duration, end_time=reservation_time + duration
+            )
+            for (reservation_time, duration), error in zip(items, errors) if error is None
+        ]
+        Reservation.objects.bulk_create(accepted)
+        # bulk_create() skips post_save, so charge the weekly usage counters here
+        reservations_saved(accepted)
+        reservations_created(accepted)
+
+        created = iter(accepted)
+        report = []
+        for (reservation_time, duration), error in zip(items, errors):
+            entry = dict(BulkReservationItemSerializer({'reservation_time': reservation_time, 'duration': duration}).data)
+            if error is None:
+                entry.update(status='accepted', id=next(created).pk)
+            else:
+                entry.update(status='rejected', error=error)
+            report.append(entry)
+
+        response_status = status.HTTP_201_CREATED if accepted else status.HTTP_400_BAD_REQUEST
+        return Response({'created': len(accepted), 'results': report}, status=response_status)
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        # Offer the nearest bookable slots so clients don't retry rejected times blindly
+        serializer = SlotSuggestionSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+
+        floor_id = user_floor_id(request.user)
+        if floor_id is None:
+            raise APIValidationError("User must be assigned to a room to make a reservation.")
+
+        params = serializer.validated_data
+        slots = suggest_slots(
+            floor_id, request.user.room_id, params['reservation_time'], params['duration'],
+            params['flexibility'], params['k']
+        )
+        slots = [(reservation_time, duration) for reservation_time, duration in slots if not allocation_pending(reservation_time)]
+        return Response({
+            'suggestions': [
+                BulkReservationItemSerializer({'reservation_time': reservation_time, 'duration': duration}).data
+                for reservation_time, duration in slots
+            ]
+        })
+
+    @action(detail=False, methods=['get', 'post'])
+    def preferences(self, request):
+        # Request window mode: rooms rank the slots they want next week instead of racing for them
+        if not request_window_enabled():
+            raise Http404
+
+        week_start = request_week()
+        if request.method == 'GET':
+            preferences = SlotPreference.objects.filter(
+                room_id=request.user.room_id, week_start=week_start
+            ).order_by('rank')
+            return Response({
+                'week_start': week_start,
+                'preferences': SlotPreferenceSerializer(preferences, many=True).data,
+            })
+
+        room = request.user.room
+        if not room:
+            raise APIValidationError("User must be assigned to a room to make a reservation.")
+        if AllocationRun.objects.filter(week_start=week_start).exists():
+            raise APIValidationError("Next week has already been allocated.")
+
+        # Accept a bare list as shorthand for {"preferences": [...]}
+        data = {'preferences': request.data} if isinstance(request.data, list) else request.data
+        serializer = SlotPreferenceRequestSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        # A new submission replaces whatever the room ranked before
+        with transaction.atomic():
+            SlotPreference.objects.filter(room=room, week_start=week_start).delete()
+            preferences = SlotPreference.objects.bulk_create([
+                SlotPreference(
+                    room=room, individual=request.user, week_start=week_start, rank=rank,
+                    reservation_time=item['reservation_time'], duration=item['duration']
+                )
+                for rank, item in enumerate(serializer.validated_data['preferences'], start=1)
+            ])
+        return Response({
+            'week_start': week_start,
+            'preferences': SlotPreferenceSerializer(preferences, many=True).data,
+        }, status=status.HTTP_201_CREATED)
 
     def perform_create(self, serializer):
         # Automatically assign the current user and their room to the reservation
@@ -84,4 +307,35 @@ class ReservationViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     def perform_destroy(self, instance):
-        instance.delete()
\ No newline at end of file
+        instance.delete()
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def analytics(self, request):
+        # Weekday/hour heatmap and per-room quota usage over whole weeks, by default the last semester
+        params = request.query_params
+        try:
+            floor_id = int(params['floor']) if params.get('floor') else None
+        except ValueError:
+            raise APIValidationError({'floor': "Expected a floor id."})
+        return Response(utilisation_report(
+            parse_window_bound(params['from'], 'from') if params.get('from') else None,
+            parse_window_bound(params['to'], 'to') if params.get('to') else None,
+            floor_id
+        ))
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        # Stream rows as they are read so memory stays flat and the first byte is sent right away
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise APIValidationError({'export_format': f"Choose one of: {', '.join(EXPORT_FORMATS)}."})
+
+        params = request.query_params
+        queryset = export_queryset(
+            parse_window_bound(params['from'], 'from') if params.get('from') else None,
+            parse_window_bound(params['to'], 'to') if params.get('to') else None,
+        )
+        iter_lines, content_type = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(iter_lines(export_rows(queryset)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="reservations.{export_format}"'
+        return response
\ No newline at end of file